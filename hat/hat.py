@@ -376,12 +376,13 @@ class Hat(object):
         self.lcd = LCD(self)
         #time.sleep(1)
 
-        self.watchlist = ['ap.enabled', 'ap.heading_command', 'ap.mode']
-        self.watchlist += ['profile', 'profiles']
+        self.watchlist = ['ap.heading_command', 'ap.mode', 'profile']
         self.watchlist += ['ap.tack.state', 'ap.tack.direction']
 
         for name in self.watchlist:
             self.client.watch(name)
+        self.client.subscribe('ap.enabled', self.receive_enabled)
+        self.client.subscribe('profiles', self.receive_profiles)
 
         # receive heading once per second for mode changes
         self.client.watch('ap.heading', 1)
@@ -574,6 +575,26 @@ class Hat(object):
                     print('shutting down since pilots updated')
                     exit(0) #respawn
 
+    def receive_enabled(self, enabled):
+        self.last_msg['ap.enabled'] = enabled
+        if self.arduino: # need to know if we are enabled for udp control
+            self.arduino.send(('ap.enabled', enabled))
+
+    def receive_profiles(self, profiles):
+        self.last_msg['profiles'] = profiles
+        self.web.send({'profiles': profiles + ['prev', 'next']})
+        for action in self.profile_actions:
+            self.actions.remove(action)
+        self.profile_actions = []
+        for profile in profiles:
+            action = ActionProfile(self, profile)
+            self.profile_actions.append(action)
+            self.actions.append(action)
+        for action in ActionProfileRelative(self, 'prev', -1), \
+                      ActionProfileRelative(self, 'next', 1):
+            self.profile_actions.append(action)
+            self.actions.append(action)
+
     def poll(self):            
         t0 = time.monotonic()
         for i in self.inputs:
@@ -609,25 +630,6 @@ class Hat(object):
         for name, value in msgs.items():
             self.last_msg[name] = value
 
-        ena = 'ap.enabled' #need to know if we are enabled for udp control
-        if self.arduino and ena in msgs:
-            self.arduino.send((ena, msgs[ena]))
-
-        if 'profiles' in msgs:
-            profiles = msgs['profiles']
-            self.web.send({'profiles': profiles + ['prev', 'next']})
-            for action in self.profile_actions:
-                self.actions.remove(action)
-            self.profile_actions = []
-            for profile in profiles:
-                action = ActionProfile(self, profile)
-                self.profile_actions.append(action)
-                self.actions.append(action)
-            for action in ActionProfileRelative(self, 'prev', -1), \
-                          ActionProfileRelative(self, 'next', 1):
-                self.profile_actions.append(action)
-                self.actions.append(action)
-
         for i in [self.lcd, self.web]:
             i.poll()
         t3 = time.monotonic()
@@ -0,0 +1,208 @@
+#!/usr/bin/env python
+#
+#   Copyright (C) 2022 Sean D'Epagnier
+#
+# This Program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation; either
+# version 3 of the License, or (at your option) any later version.
+
+# asyncio client for the pypilot server, uses the same protocol as
+# pypilotClient but waits on the connection rather than polling
+#
+#    client = pypilotAsyncClient(host)
+#    await client.connect()
+#    await client.watch('ap.heading', 1)
+#    await client.set('ap.enabled', True)
+#    async for name, value in client:
+#        print(name, value)
+
+import asyncio, sys, os
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import gettext_loader
+import pyjson
+from client import DEFAULT_PORT, unix_socket_name, local_hosts
+
+keepalive_period = 3 # seconds without data before sending a linefeed
+reconnect_period = 3
+
+class pypilotAsyncClient(object):
+    def __init__(self, host='127.0.0.1', port=None):
+        if ':' in host:
+            host, port = host.split(':', 1)
+        self.host, self.port = host, int(port or DEFAULT_PORT)
+        self.reader = self.writer = None
+        self.task = None
+        self.watches = {}
+        self.received = asyncio.Queue()
+        self.requests = {} # futures for replies to each request in order sent
+
+    # prefer the unix socket of a server on this host
+    async def open_connection(self):
+        if self.host in local_hosts and self.port == DEFAULT_PORT:
+            try:
+                return await asyncio.open_unix_connection(unix_socket_name)
+            except (OSError, AttributeError):
+                pass
+        return await asyncio.open_connection(self.host, self.port)
+
+    async def connect(self):
+        self.reader, self.writer = await self.open_connection()
+        if self.watches:
+            self.write('watch=' + pyjson.dumps(self.watches) + '\n')
+        if not self.task:
+            self.task = asyncio.ensure_future(self.run())
+
+    async def close(self):
+        if self.task:
+            self.task.cancel()
+            self.task = None
+        if self.writer:
+            self.writer.close()
+            self.writer = None
+        self.fail_requests()
+
+    # requests waiting for a reply which will not come return False
+    def fail_requests(self):
+        for futures in self.requests.values():
+            for future in futures:
+                if not future.done():
+                    future.set_result(False)
+        self.requests = {}
+
+    def write(self, data):
+        if self.writer:
+            self.writer.write(data.encode())
+
+    async def send(self, data):
+        self.write(data)
+        if self.writer:
+            await self.writer.drain()
+
+    async def set(self, name, value):
+        await self.send(name + '=' + pyjson.dumps(value) + '\n')
+
+    async def watch(self, name, period=True):
+        if period is False:
+            if not name in self.watches:
+                return # already not watching
+            del self.watches[name]
+        else:
+            self.watches[name] = period
+        await self.send('watch=' + pyjson.dumps({name: period}) + '\n')
+
+    # send a request to the server and wait for the reply of the same name
+    async def request(self, name, data):
+        if not self.writer:
+            return False # not connected
+        future = asyncio.get_running_loop().create_future()
+        self.requests.setdefault(name, []).append(future)
+        await self.send(name + '=' + pyjson.dumps(data) + '\n')
+        return await future
+
+    # current values of names, or all values, without watching them
+    async def snapshot(self, names=True):
+        return await self.request('snapshot', names)
+
+    # recorded samples of values with history, request is {name: seconds}
+    async def history(self, request):
+        return await self.request('history', request)
+
+    async def get(self, name):
+        values = await self.snapshot([name])
+        return values and values.get(name)
+
+    async def list_values(self):
+        values = await self.snapshot(['values'])
+        return values and values.get('values')
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        return await self.received.get()
+
+    def receive_line(self, line):
+        try:
+            name, data = line.rstrip().split('=', 1)
+            if name == 'error':
+                print(_('server error:'), data)
+                for name in self.requests:
+                    if name in data: # server does not support request
+                        self.reply(name, False)
+                return
+            value = pyjson.loads(data)
+        except ValueError as e:
+            print('client value error:', line, e)
+            return
+
+        if self.requests.get(name):
+            self.reply(name, value)
+            return
+        self.received.put_nowait((name, value))
+
+    def reply(self, name, value):
+        futures = self.requests[name]
+        if futures:
+            future = futures.pop(0)
+            if not future.done(): # unless cancelled waiting
+                future.set_result(value)
+
+    async def run(self):
+        while True:
+            try:
+                # send a linefeed after a time without data to detect a lost connection
+                line = await asyncio.wait_for(self.reader.readline(), keepalive_period)
+            except asyncio.TimeoutError:
+                try:
+                    await self.send('\n')
+                    continue
+                except OSError: # lost connection
+                    line = False
+            except ConnectionError:
+                line = False
+            if line:
+                self.receive_line(line.decode())
+                continue
+
+            # lost connection, reconnect and restore watches
+            self.writer.close()
+            self.writer = None
+            self.fail_requests()
+            while not self.writer:
+                await asyncio.sleep(reconnect_period)
+                try:
+                    self.reader, self.writer = await self.open_connection()
+                except OSError:
+                    continue
+            if self.watches:
+                self.write('watch=' + pyjson.dumps(self.watches) + '\n')
+
+# print values continuously as they are updated
+def main():
+    async def watch(host, names):
+        client = pypilotAsyncClient(host)
+        await client.connect()
+        if not names:
+            names = await client.list_values()
+            if not names:
+                print(_('failed to retrieve value list!'))
+                return
+        for name in names:
+            await client.watch(name)
+        async for name, value in client:
+            print(name, '=', value)
+
+    args = sys.argv[1:]
+    host = '127.0.0.1'
+    if len(args) > 1 and args[0] == '-s':
+        host = args[1]
+        args = args[2:]
+    try:
+        asyncio.run(watch(host, args))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main()
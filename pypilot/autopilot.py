@@ -36,7 +36,7 @@ def minmax(value, r):
 class ModeProperty(EnumProperty):
     def __init__(self, name, ap):
         self.ap = ap
-        super(ModeProperty, self).__init__(name, 'compass', ['compass', 'gps', 'nav', 'wind', 'true wind'], persistent=True)
+        super(ModeProperty, self).__init__(name, 'compass', ['compass', 'gps', 'nav', 'wind', 'true wind'], persistent=True, control=True)
 
     def set(self, value):
         # update the preferred mode when the mode changes from user
@@ -50,7 +50,7 @@ class ModeProperty(EnumProperty):
 class HeadingProperty(RangeProperty):
     def __init__(self, name, mode):
         self.mode = mode
-        super(HeadingProperty, self).__init__(name, 0, -180, 360)
+        super(HeadingProperty, self).__init__(name, 0, -180, 360, control=True)
 
     # +-180 for wind modes 0-360 for compass and gps modes
     def set(self, value):
@@ -109,14 +109,14 @@ class Autopilot(object):
         self.lastmode = False    
         
         self.heading_command = self.register(HeadingProperty, 'heading_command', self.mode)
-        self.enabled = self.register(BooleanProperty, 'enabled', False)
+        self.enabled = self.register(BooleanProperty, 'enabled', False, control=True)
         self.lastenabled = False
         
         self.last_heading = False
         self.last_heading_off = self.boatimu.heading_off.value
 
-        self.heading = self.register(SensorValue, 'heading', directional=True)
-        self.heading_error = self.register(SensorValue, 'heading_error')
+        self.heading = self.register(SensorValue, 'heading', directional=True, history=True)
+        self.heading_error = self.register(SensorValue, 'heading_error', history=True)
         self.heading_error_int = self.register(SensorValue, 'heading_error_int')
         self.heading_error_int_time = time.monotonic()
 
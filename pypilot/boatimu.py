@@ -37,7 +37,7 @@ class IMU(object):
         self.client = pypilotClient(server)
         self.multiprocessing = server.multiprocessing
         if self.multiprocessing:
-            self.pipe, pipe = NonBlockingPipe('imu pipe', self.multiprocessing)
+            self.pipe, pipe = NonBlockingPipe('imu pipe', self.multiprocessing, shared_memory=True)
             self.process = multiprocessing.Process(target=self.process, args=(pipe,), daemon=True)
             self.process.start()
             return
@@ -412,10 +412,11 @@ class BoatIMU(object):
         sensornames += ['headingrate_lowpass', 'headingraterate_lowpass']
         directional_sensornames = ['heading', 'heading_lowpass']
         sensornames += directional_sensornames
+        history_sensornames = ['pitch', 'roll', 'heel', 'heading']
     
         self.SensorValues = {}
         for name in sensornames:
-            self.SensorValues[name] = self.register(SensorValue, name, directional = name in directional_sensornames)
+            self.SensorValues[name] = self.register(SensorValue, name, directional = name in directional_sensornames, history = name in history_sensornames)
 
         # quaternion needs to report many more decimal places than other sensors
         #sensornames += ['fusionQPose']
@@ -8,6 +8,23 @@
 # version 3 of the License, or (at your option) any later version.  
 
 import time, select, socket, os
+from framing import text_frame, frame_boundary
+
+# a client which can not receive all the data sent within a second is slow,
+# it receives values at most every throttle seconds, doubled each second it
+# stays behind and halved each second it keeps up
+min_throttle = .05
+max_throttle = 1.6
+
+def update_throttle(socket, t):
+    if socket.behind:
+        socket.throttle = min(max(socket.throttle*2, min_throttle), max_throttle)
+    elif socket.throttle:
+        socket.throttle /= 2
+        if socket.throttle < min_throttle:
+            socket.throttle = 0
+    socket.behind = False
+    socket.throttle_time = t + 1
 
 try:
   from pypilot.linebuffer import linebuffer
@@ -18,16 +35,24 @@ try:
 
         self.socket = connection
         self.address = address
-        self.out_buffer = ''
+        self.out_buffer = bytearray() # sent data is deleted from the front without copying
+        self.pending = {} # latest unsent update for each value
+        self.priority = {} # updates of control values sent ahead of pending values
+        self.framing = False # or set of value ids sent in binary framing
+        self.frame_end = 0 # end of the partially sent frame in out_buffer
 
         self.udp_port = False
-        self.udp_out_buffer = ''
+        self.udp_out_buffer = bytearray()
         self.udp_socket = False
 
         self.pollout = select.poll()
         self.pollout.register(connection, select.POLLOUT)
         self.sendfail_msg = 1
         self.sendfail_cnt = 0
+        self.bytes_in = self.bytes_out = 0 # counted by the server for statistics
+        self.throttle = 0 # minimum time between sending values
+        self.throttle_time = self.pending_time = 0
+        self.behind = False # data was left unsent
 
     def fileno(self):
         if self.socket:
@@ -50,47 +75,106 @@ try:
 
     def write(self, data, udp=False):
         if udp and self.udp_port:
-          self.udp_out_buffer += data
+          self.udp_out_buffer += data.encode()
           if len(self.udp_out_buffer) > 400:
             print(_('overflow in pypilot udp socket'), self.address, len(self.udp_out_buffer))
-            self.udp_out_buffer = ''
+            self.udp_out_buffer.clear()
         else:
+          if type(data) == type(''):
+            if self.framing is not False:
+              data = text_frame(data)
+            else:
+              data = data.encode()
           self.out_buffer += data
           if len(self.out_buffer) > 65536:
             print(_('overflow in pypilot socket'), self.address, len(self.out_buffer), os.getpid())
-            self.out_buffer = ''
+            self.out_buffer.clear()
+            self.frame_end = 0
             self.close()
-    
+
+    # value updates replace any unsent update of the same value
+    def write_value(self, name, data, udp=False):
+        if udp and self.udp_port:
+            self.write(data, True)
+        else:
+            self.pending[name] = data
+
+    def write_priority(self, name, data, udp=False):
+        if udp and self.udp_port:
+            self.write(data, True)
+        else:
+            self.pending.pop(name, None) # would replace this newer value
+            self.priority[name] = data
+
+    # control values do not wait for the data being sent, they are
+    # inserted after the line or frame which is partially sent
+    def queue_priority(self):
+        if self.framing is False:
+            data = ''.join(self.priority.values()).encode()
+            i = self.out_buffer.find(b'\n') + 1
+        else:
+            data = b''.join(self.priority.values())
+            i = self.frame_end
+        self.out_buffer[i:i] = data
+        self.priority = {}
+
+    def queue_pending(self, t):
+        # only queue values once earlier data is sent so they are the latest
+        if self.out_buffer:
+            return
+        if t < self.pending_time:
+            return # slow client, values wait so fewer are sent
+        self.pending_time = t + self.throttle
+        data = self.pending.values()
+        if self.framing is False:
+            self.out_buffer += ''.join(data).encode()
+        else:
+            self.out_buffer += b''.join(data)
+        self.pending = {}
+
     def flush(self):
         if self.udp_out_buffer:
             try:
                 if not self.udp_socket:
                     self.udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-                count = self.udp_socket.sendto(self.udp_out_buffer.encode(), (self.address[0], self.udp_port))
+                count = self.udp_socket.sendto(self.udp_out_buffer, (self.address[0], self.udp_port))
             except Exception as e:
                 print('udp socket failed to send', e)
                 count = 0
                 self.close()
             if count != len(self.udp_out_buffer):
                 print(_('failed to send udp packet'), self.address)
-            self.udp_out_buffer = ''
-        
+            self.udp_out_buffer.clear()
+
+        if self.priority:
+            self.queue_priority()
+        if not self.pending and not self.out_buffer:
+            return
+        t = time.monotonic()
+        if t >= self.throttle_time:
+            update_throttle(self, t)
+        if self.pending:
+            self.queue_pending(t)
         if not self.out_buffer:
             return
 
         try:
             if not self.pollout.poll(0):
+                self.behind = True
                 if self.sendfail_cnt >= self.sendfail_msg:
                     print(_('pypilot socket failed to send to'), self.address, self.sendfail_cnt)
                     self.sendfail_msg *= 10
                 self.sendfail_cnt += 1
 
-                if self.sendfail_cnt > 100:
-                    self.socket.close()
-                    return
-  
+                # slow clients only fall behind on values, give up if the socket
+                # is stuck even at the lowest rate
+                if self.sendfail_cnt > 100 and self.throttle == max_throttle:
+                    self.close()
+                return
+            self.sendfail_cnt = 0
+
             t0 = time.monotonic()
-            count = self.socket.send(self.out_buffer.encode())
+            count = self.socket.send(self.out_buffer)
             #print('write', count, self.out_buffer, time.monotonic())
             t1 = time.monotonic()
 
@@ -99,7 +183,12 @@ try:
             if count < 0:
                 print(_('socket send error'), self.address, count)
                 self.socket.close()
-            self.out_buffer = self.out_buffer[count:]
+            if self.framing is not False:
+                self.frame_end = frame_boundary(self.out_buffer, self.frame_end, count) - count
+            del self.out_buffer[:count]
+            self.bytes_out += count
+            if self.out_buffer:
+                self.behind = True
         except Exception as e:
             print(_('pypilot socket exception'), self.address, e, os.getpid(), self.socket)
             self.close()
@@ -114,7 +203,16 @@ except Exception as e:
         self.b = False # in python
         self.in_buffer = ''
         self.no_newline_pos = 0
-        self.out_buffer = ''
+        self.out_buffer = bytearray()
+        self.pending = {}
+        self.priority = {}
+        self.framing = False
+        self.udp_port = False
+        self.sendfail_cnt = 0
+        self.bytes_in = self.bytes_out = 0
+        self.throttle = 0
+        self.throttle_time = self.pending_time = 0
+        self.behind = False
 
     def close(self):
         self.socket.close()
@@ -122,23 +220,58 @@ except Exception as e:
     def fileno(self):
         return self.socket.fileno()
 
-    def write(self, data):
+    def write(self, data, udp=False):
+        if type(data) == type(''):
+            if self.framing is not False:
+                data = text_frame(data)
+            else:
+                data = data.encode()
         self.out_buffer += data
 
+    def write_value(self, name, data, udp=False):
+        self.pending[name] = data
+
+    def write_priority(self, name, data, udp=False):
+        self.pending.pop(name, None)
+        self.priority[name] = data
+
     def flush(self):
+        if self.priority:
+            if self.framing is False:
+                self.out_buffer += ''.join(self.priority.values()).encode()
+            else:
+                self.out_buffer += b''.join(self.priority.values())
+            self.priority = {}
+        if not self.pending and not self.out_buffer:
+            return
+        t = time.monotonic()
+        if t >= self.throttle_time:
+            update_throttle(self, t)
+        if self.pending and not self.out_buffer:
+            if t >= self.pending_time:
+                self.pending_time = t + self.throttle
+                data = self.pending.values()
+                if self.framing is False:
+                    self.out_buffer += ''.join(data).encode()
+                else:
+                    self.out_buffer += b''.join(data)
+                self.pending = {}
         if not len(self.out_buffer):
             return
         try:
-            count = self.socket.send(self.out_buffer.encode())
+            count = self.socket.send(self.out_buffer)
             if count < 0:
                 print(_('socket send error in server flush'))
-                self.out_buffer = ''
+                self.out_buffer.clear()
                 self.socket.close()
                 return
 
-            self.out_buffer = self.out_buffer[count:]
+            del self.out_buffer[:count]
+            self.bytes_out += count
+            if self.out_buffer:
+                self.behind = True
         except:
-            self.out_buffer = ''
+            self.out_buffer.clear()
             self.socket.close()
 
     def recvdata(self):
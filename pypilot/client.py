@@ -8,15 +8,19 @@
 # version 3 of the License, or (at your option) any later version.  
 
 import socket, select, sys, os, time
+from collections import deque
 
-import heapq
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 import pyjson
 import gettext_loader
 from bufferedsocket import LineBufferedNonBlockingSocket
+from framing import FrameReader
 from values import Value
+from timerwheel import TimerWheel
 
 DEFAULT_PORT = 23322
+unix_socket_name = '\0pypilot' # abstract unix socket of a server on this host
+local_hosts = ['127.0.0.1', 'localhost']
 udp_control_port = 43822
 
 try:
@@ -30,6 +34,15 @@ except:
     print('select.POLLNVAL not defined, using 32')
     ourPOLLNVAL = 32
     
+# period in seconds of a watch request, True watches every update and
+# dicts such as {"period": 1, "aggregate": "mean"} give their period
+def watch_period(period):
+    if isinstance(period, dict):
+        return period.get('period', 0)
+    if period is True:
+        return 0
+    return period
+
 class Watch(object):
     def __init__(self, value, period):
         self.value = value
@@ -52,7 +65,7 @@ class ClientWatch(Value):
                 if period is True:
                     period = 0
                 if not value.watch or value.watch.period > period:
-                    self.client.send(name + '=' + value.get_msg() + '\n') # initial send
+                    self.client.send(value.get_line()) # initial send
                 value.watch = Watch(value, period)
                 value.pwatch = True
 
@@ -64,7 +77,8 @@ class ClientValues(Value):
         self.values = {'values': self}
         self.values['watch'] = ClientWatch(self.values, client)
         self.wvalues = {}
-        self.pqwatches = []
+        self.wheel = TimerWheel() # periodic watches waiting to be sent
+        self.version = '' # server directory version of value
 
     def set(self, values):
         if self.value is False:
@@ -73,21 +87,25 @@ class ClientValues(Value):
             for name in values:
                 self.value[name] = values[name]
 
+    # the server sends its version before directory updates, a version
+    # from a different server means the full directory follows
+    def set_version(self, version):
+        if version.split(':')[0] != self.version.split(':')[0]:
+            self.value = False
+        self.version = version
+
     def send_watches(self):
         t0 = time.monotonic()
-        while self.pqwatches:
-            if t0 < self.pqwatches[0][0]:
-                break # no more are ready
-            t, i, watch = heapq.heappop(self.pqwatches) # pop first element
+        for watch in self.wheel.expire(t0):
             if watch.value.watch == watch:
-                self.client.send(watch.value.name + '=' + watch.value.get_msg() + '\n')
+                self.client.send(watch.value.get_line())
                 watch.time += watch.period
                 if watch.time < t0:
                     watch.time = t0
                 watch.value.pwatch = True # can watch again once updated
             
     def insert_watch(self, watch):
-        heapq.heappush(self.pqwatches, (watch.time, time.monotonic(), watch))
+        self.wheel.insert(watch)
 
     def register(self, value):
         if value.name in self.values:
@@ -100,22 +118,34 @@ class ClientValues(Value):
         self.wvalues = {}
         return ret
 
+    def get_line(self): # not cached, the message is consumed
+        return 'values=' + self.get_msg() + '\n'
+
     def onconnected(self):
         for name in self.values:
             if name != 'values' and name != 'watch':
                 self.wvalues[name] = self.values[name].info
 
 class pypilotClient(object):
-    def __init__(self, host=False, use_udp=False):
+    def __init__(self, host=False, use_udp=False, binary=False, resume=False):
         if sys.version_info[0] < 3:
             import failedimports
 
         self.values = ClientValues(self)
         self.watches = {}
         self.wwatches = {}
-        self.received = []
+        self.received = deque()
+        self.callbacks = {} # subscribed values are passed to callbacks rather than received
         self.last_values_list = False
         self.udp_socket = False
+        self.binary = binary # request binary framing from the server
+        self.framing_pending = False
+        self.replies = {} # replies to requests such as snapshot, False until received
+        # after reconnecting only receive values which changed while disconnected
+        self.resume = resume
+        self.resume_seq = False # last sequence marker from the server
+        self.resume_names = [] # values received before that marker
+        self.have = set() # names of remote values received
 
         if False:
             self.server = host
@@ -125,6 +155,7 @@ class pypilotClient(object):
             # host is the server object for direct pipe connection
             self.server = host
             self.connection = host.pipe()
+            self.reader = self.connection
             self.poller = select.poll()
             fd = self.connection.fileno()
             if fd:
@@ -210,12 +241,31 @@ class pypilotClient(object):
         self.poller = select.poll()
         self.poller.register(self.connection.socket, select.POLLIN)
 
-        if self.watches:
-            self.connection.write('watch=' + pyjson.dumps(self.watches) + '\n')
-        self.wwatches = {}
+        if self.binary:
+            # read raw data, hold watches until the server replies
+            self.reader = FrameReader(self.connection.socket)
+            self.connection.write('framing="binary"\n')
+            self.framing_pending = True
+            self.wwatches = dict(self.watches)
+            self.write_resume()
+        else:
+            self.reader = self.connection
+            self.write_resume()
+            if self.watches:
+                self.connection.write(self.watch_line(self.watches))
+            self.wwatches = {}
 
         self.values.onconnected()
 
+    def write_resume(self):
+        if not self.resume:
+            return
+        request = {}
+        if self.resume_seq:
+            request['seq'] = self.resume_seq
+            request['names'] = [name for name in self.resume_names if name in self.watches]
+        self.connection.write('resume=' + pyjson.dumps(request) + '\n')
+
     def probe(self):
         if not self.can_probe:
             return # do not search if host is specified by commandline, or again
@@ -280,8 +330,8 @@ class pypilotClient(object):
                 return
             
         # inform server of any watches we have changed
-        if self.wwatches:
-            self.connection.write('watch=' + pyjson.dumps(self.wwatches) + '\n')
+        if self.wwatches and not self.framing_pending:
+            self.connection.write(self.watch_line(self.wwatches))
             #print('client watch', self.wwatches, self.watches)
             self.wwatches = {}
 
@@ -310,49 +360,67 @@ class pypilotClient(object):
 
             self.update_timeout()
             
-            fd, flag = events.pop()
-
-            if fd == self.connection.fileno():
-                if not (flag & select.POLLIN) or (self.connection and not self.connection.recvdata()):
-                    # other flags indicate disconnect
-                    self.disconnect() # recv returns 0 means connection closed
-                    return
-            elif self.udp_socket and fd == self.udp_socket.fileno():
-                if not (flag & select.POLLIN):
-                    print(_('lost udp_socket'))
-                    self.udp_socket.close()
-                    self.udp_socket = False
-                else:
-                    try:
-                        while True:
-                            line = self.udp_socket.recvfrom(128)
-                            if not line:
-                                break
-                            if 'servo.command' in self.values.values:
-                                self.values.values['servo.command'].set(float(line[0]))
-
-                    except OSError as e:
-                        import errno
-                        if e.args[0] is errno.EAGAIN:
-                            pass
-                        else:
-                            print("unknown os error", e)
-                    except Exception as e:
-                        self.poller.unregister(self.udp_socket)
+            for fd, flag in events: # handle every ready event
+                if fd == self.connection.fileno():
+                    if not (flag & select.POLLIN) or (self.connection and not self.reader.recvdata()):
+                        # other flags indicate disconnect
+                        self.disconnect() # recv returns 0 means connection closed
+                        return
+                elif self.udp_socket and fd == self.udp_socket.fileno():
+                    if not (flag & select.POLLIN):
+                        print(_('lost udp_socket'))
                         self.udp_socket.close()
                         self.udp_socket = False
-                        print("failed  udp??\n", e, line)
+                    else:
+                        try:
+                            while True:
+                                line = self.udp_socket.recvfrom(128)
+                                if not line:
+                                    break
+                                if 'servo.command' in self.values.values:
+                                    self.values.values['servo.command'].set(float(line[0]))
+
+                        except OSError as e:
+                            import errno
+                            if e.args[0] is errno.EAGAIN:
+                                pass
+                            else:
+                                print("unknown os error", e)
+                        except Exception as e:
+                            self.poller.unregister(self.udp_socket)
+                            self.udp_socket.close()
+                            self.udp_socket = False
+                            print("failed  udp??\n", e, line)
 
         # read incoming data line by line
         while True:
-            line = self.connection.readline()
+            line = self.reader.readline()
             if not line:
                 return
+            if type(line) == type(()): # already decoded binary frame
+                name, value = line
+                self.receive_value(name, value)
+                continue
             #print('client line', line, time.monotonic())
             try:
                 name, data = line.rstrip().split('=', 1)
                 if name == 'error':
                     print('server error:', data)
+                    if self.framing_pending and 'framing' in data:
+                        self.framing_pending = False # server only supports text
+                    for request in self.replies:
+                        if request in data:
+                            self.replies[request] = None # server does not support request
+                    continue
+                if name == 'framing':
+                    self.framing_pending = False
+                    continue
+                if name == 'values_version':
+                    self.values.set_version(pyjson.loads(data))
+                    continue
+                if name == 'seq':
+                    self.resume_seq = pyjson.loads(data)
+                    self.resume_names = list(self.have)
                     continue
                 value = pyjson.loads(data)
             except ValueError as e:
@@ -363,16 +431,36 @@ class pypilotClient(object):
                 print(_('invalid message from server:'), line, e)
                 raise Exception()
 
-            if name in self.values.values: # did this client register this value
-                self.values.values[name].set(value)
-            else:
-                self.received.append((name, value)) # remote value
+            if name in self.replies:
+                self.replies[name] = value
+                continue
+            self.receive_value(name, value)
+
+    def watch_line(self, watches):
+        line = 'watch=' + pyjson.dumps(watches) + '\n'
+        if watches.get('values') is True:
+            # send the cached directory version to receive only what changed
+            line = 'values_version=' + pyjson.dumps(self.values.version) + '\n' + line
+        return line
+
+    def receive_value(self, name, value):
+        if name in self.values.values: # did this client register this value
+            self.values.values[name].set(value)
+            return
+        if self.resume:
+            self.have.add(name)
+        if name in self.callbacks:
+            for callback in self.callbacks[name]:
+                callback(value)
+        else:
+            self.received.append((name, value)) # remote value
 
     # polls at least as long as timeout
     def disconnect(self):
         if self.connection:
             self.connection.close()
         self.connection = False
+        self.framing_pending = False
 
     def probewait(self, timeout):
         t0 = time.monotonic()
@@ -386,6 +474,10 @@ class pypilotClient(object):
         if self.connection:
             print(_('warning, pypilot client aleady has connection'))
 
+        if self.connect_unix():
+            self.onconnected()
+            return True
+
         try:
             host_port = self.config['host'], self.config['port']
             self.connection_in_progress = False
@@ -418,22 +510,49 @@ class pypilotClient(object):
         self.onconnected()
         return True
     
+    # a server on this host also listens on a unix socket which avoids the tcp stack
+    def connect_unix(self):
+        if not self.config['host'] in local_hosts or int(self.config['port']) != DEFAULT_PORT:
+            return False
+        try:
+            connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        except (OSError, AttributeError): # no unix sockets on this os
+            return False
+        try:
+            connection.connect(unix_socket_name)
+        except OSError:
+            connection.close()
+            return False
+        self.connection_in_progress = connection
+        return True
+
     def receive_single(self):
         if self.received:
-            ret = self.received[0]
-            self.received = self.received[1:]
-            return ret
+            return self.received.popleft()
         return False
 
     def receive(self, timeout=0):
         self.poll(timeout)
-        ret = {}
-        for msg in self.received:
-            name, value = msg
-            ret[name] = value
-        self.received = []
+        ret = dict(self.received)
+        self.received.clear()
         return ret
 
+    # call callback with each update of a remote value as it is received
+    def subscribe(self, name, callback, period=True):
+        if not name in self.callbacks:
+            self.callbacks[name] = []
+        self.callbacks[name].append(callback)
+        self.watch(name, period)
+
+    def unsubscribe(self, name, callback):
+        callbacks = self.callbacks.get(name)
+        if not callbacks or not callback in callbacks:
+            return
+        callbacks.remove(callback)
+        if not callbacks:
+            del self.callbacks[name]
+            self.watch(name, False)
+
     def update_timeout(self):
         if self.timeout_time:
             self.timeout_time = time.monotonic()            
@@ -456,6 +575,7 @@ class pypilotClient(object):
             if value is False:
                 del self.watches[name]
                 self.wwatches[name] = value
+                self.have.discard(name)
                 return
             elif self.watches[name] is value:
                 return # same watch ignore
@@ -493,6 +613,32 @@ class pypilotClient(object):
         self.last_values_list = ret
         return ret
 
+    # send a request to the server and wait for the reply of the same name
+    def request(self, name, data, timeout):
+        self.replies[name] = False
+        t0, sent = time.monotonic(), False
+        while self.replies[name] is False:
+            dt = timeout - (time.monotonic() - t0)
+            if dt < 0:
+                break
+            if not sent and self.connection:
+                self.send(name + '=' + pyjson.dumps(data) + '\n')
+                sent = True
+            self.poll(min(dt, .1))
+        reply = self.replies.pop(name)
+        if reply is None:
+            return False
+        return reply
+
+    # current values of names, or all values if names is True, without watching them
+    def snapshot(self, names=True, timeout=1):
+        return self.request('snapshot', names, timeout)
+
+    # recorded samples of values with history, request is {name: seconds}
+    # returns {name: [times, values]} with times in seconds relative to now
+    def history(self, request, timeout=1):
+        return self.request('history', request, timeout)
+
     def info(self, name):
         return self.values.value[name]
 
@@ -566,6 +712,7 @@ def main():
         print(_('usage'), sys.argv[0], '[-s host] -i -c -h [NAME[=VALUE]]...')
         print('eg:', sys.argv[0], '-i imu.compass')
         print('   ', sys.argv[0], 'servo.max_slew_speed=10')
+        print('   ', sys.argv[0], '-c', "'imu.*'")
         print('-s', _('set the host or ip address'))
         print('-i', _('print info about each value type'))
         print('-c', _('continuous watch'))
@@ -587,39 +734,21 @@ def main():
         if arg[0] != '-':
             watches.append(arg)
 
-    period = True if continuous else 10
-    client = pypilotClientFromArgs(watches, period, host)
-    if client.watches: # retrieve all values
-        watches = list(client.watches)
+    if not continuous:
+        # read current values in a single request without watching them
+        client = pypilotClientFromArgs(watches, False, host)
         if info:
             client.list_values(10)
-    else:
-        watches = list(client.list_values(10))
-        if not watches:
-            print(_('failed to retrieve value list!'))
+        names = [arg.split('=', 1)[0] for arg in watches]
+        values = client.snapshot(names or True, 10)
+        if values is False:
+            print(_('failed to retrieve values!'))
             exit(1)
-        for name in watches:
-            client.watch(name, period)
-
-    if not continuous:
-        values = {}
-        t0 = time.monotonic()
-        while len(values) < len(watches):
-            dt = time.monotonic() - t0
-            if dt > 10:
-                print(_('timeout retrieving'), len(watches) - len(values), 'values')
-                for name in watches:
-                    if not name in values:
-                        print(_('missing'), name)
-                break
-                    
-            client.poll(.1)
-            msgs = client.receive()
-            for name in msgs:
-                values[name] = msgs[name]
-
-        names = sorted(values)
         for name in names:
+            if not name in values and not name.endswith('*'):
+                print(_('missing'), name)
+
+        for name in sorted(values):
             if info:
                 print(name, client.info(name), '=', values[name])
             else:
@@ -629,6 +758,17 @@ def main():
                     result = result[:maxlen] + ' ...'
                 print(result)
     else:
+        client = pypilotClientFromArgs(watches, True, host)
+        if not client.watches:
+            value_list = client.list_values(10)
+            if not value_list:
+                print(_('failed to retrieve value list!'))
+                exit(1)
+            for name in value_list:
+                client.watch(name)
+        elif info:
+            client.list_values(10)
+
         while True:
             client.poll(1)
             msg = client.receive_single()
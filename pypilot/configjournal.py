@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+#
+#   Copyright (C) 2022 Sean D'Epagnier
+#
+# This Program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation; either
+# version 3 of the License, or (at your option) any later version.
+
+# write-behind storage of pypilot.conf
+#
+# changed persistent values are appended to pypilot.conf.journal as
+# json lines of [profile, "name=value"].  Once enough entries build up
+# the whole configuration is written to a temporary file which replaces
+# pypilot.conf and the journal is emptied.  All file writes happen on
+# the writer thread so the server never waits for the sd card.
+
+import os, threading, queue
+import pyjson
+
+compact_entries = 256 # journal entries before rewriting the config file
+
+# write persistent data in pypilot.conf format
+def write_config(filename, persistent_data):
+    file = open(filename, 'w')
+    for name, value in persistent_data[None].items():
+        file.write(value)
+    for profile, data in persistent_data.items():
+        if profile is None:
+            continue
+        file.write('[profile="' + profile.replace('"', '') + '"]\n')
+        for name, value in data.items():
+            if value:
+                file.write(value)
+    file.flush()
+    os.fsync(file.fileno())
+    file.close()
+
+# make renames and new files in the directory of filename durable
+def fsync_directory(filename):
+    fd = os.open(os.path.dirname(os.path.abspath(filename)), os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+class ConfigJournal(threading.Thread):
+    def __init__(self, filename):
+        super(ConfigJournal, self).__init__(daemon=True)
+        self.filename = filename
+        self.journalname = filename + '.journal'
+        self.queue = queue.Queue()
+        self.entries = 0 # entries in the journal since the last compaction
+        self.compacted = False # config file was replaced
+
+    # entries not yet compacted into the config file
+    def load(self):
+        entries = []
+        try:
+            f = open(self.journalname)
+        except FileNotFoundError:
+            return entries
+        for line in f:
+            try:
+                profile, msg = pyjson.loads(line)
+            except ValueError:
+                continue # partial line from losing power during a write
+            entries.append((profile, msg))
+        f.close()
+        self.entries = len(entries)
+        return entries
+
+    def append(self, entries):
+        self.entries += len(entries)
+        self.queue.put((self.write_entries, entries))
+
+    def compact(self, persistent_data):
+        data = {} # copy as the server continues to modify persistent data
+        for profile in persistent_data:
+            data[profile] = dict(persistent_data[profile])
+        self.entries = 0
+        self.queue.put((self.write_compacted, data))
+
+    # finish all writes
+    def close(self):
+        self.queue.put(None)
+        self.join()
+
+    def write_entries(self, entries):
+        file = open(self.journalname, 'a')
+        for entry in entries:
+            file.write(pyjson.dumps(entry) + '\n')
+        file.flush()
+        os.fsync(file.fileno())
+        file.close()
+
+    def write_compacted(self, persistent_data):
+        tmp = self.filename + '.tmp'
+        write_config(tmp, persistent_data)
+        os.rename(tmp, self.filename) # atomic, pypilot.conf is always complete
+        # the rename must reach the disk first, or losing power could
+        # leave the old config file with an empty journal
+        fsync_directory(self.filename)
+        file = open(self.journalname, 'w')
+        os.fsync(file.fileno())
+        file.close()
+        self.compacted = True
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            if not item:
+                break
+            write, data = item
+            try:
+                write(data)
+            except Exception as e:
+                print(_('failed to write'), self.filename, e)
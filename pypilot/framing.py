@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+#
+#   Copyright (C) 2022 Sean D'Epagnier
+#
+# This Program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation; either
+# version 3 of the License, or (at your option) any later version.
+
+# optional compact binary framing for tcp clients
+#
+# a client sends framing="binary" as its first line, the server
+# replies framing="binary" in text and all further output from the
+# server is framed.  Input from clients remains text lines.
+#
+# each frame is a header of kind, id, length followed by the payload.
+# values are referred to by id, and the name for an id is sent once
+# per connection before its first use.  Sensor values which are
+# numbers or lists of numbers are sent as packed doubles.
+
+import struct
+import pyjson
+
+FRAME_NAME = 0   # payload is the name for id
+FRAME_JSON = 1   # payload is json text of the value
+FRAME_FLOAT = 2  # payload is a single double
+FRAME_FLOATS = 3 # payload is a list of doubles
+FRAME_TEXT = 4   # payload is a text protocol line such as error=...
+
+# ids are 32 bits so they never wrap as values are added while running
+header = struct.Struct('<BII')
+float_frame = struct.Struct('<BIId')
+
+def name_frame(id, name):
+    name = name.encode()
+    return header.pack(FRAME_NAME, id, len(name)) + name
+
+def text_frame(line):
+    line = line.encode()
+    return header.pack(FRAME_TEXT, 0, len(line)) + line
+
+# data is the json text of the value
+def value_frame(id, data, sensor):
+    if sensor:
+        try:
+            if data[0] == '[':
+                floats = [float(x) for x in data[1:-1].split(',')]
+                n = len(floats)
+                return header.pack(FRAME_FLOATS, id, 8*n) + struct.pack('<%dd' % n, *floats)
+            return float_frame.pack(FRAME_FLOAT, id, 8, float(data))
+        except ValueError:
+            pass # not numeric, send as json
+    data = data.encode()
+    return header.pack(FRAME_JSON, id, len(data)) + data
+
+# offset of the first frame boundary at or after count in buffer,
+# walking frames from the boundary at pos
+def frame_boundary(buffer, pos, count):
+    while pos < count:
+        kind, id, length = header.unpack_from(buffer, pos)
+        pos += header.size + length
+    return pos
+
+# reads text lines until the framing reply, then frames
+class FrameReader(object):
+    def __init__(self, socket):
+        self.socket = socket
+        self.buffer = bytearray()
+        self.pos = 0
+        self.binary = False
+        self.names = {}
+
+    def recvdata(self):
+        try:
+            data = self.socket.recv(65536)
+        except (BlockingIOError, InterruptedError):
+            return True
+        except Exception as e:
+            print(_('error receiving data'), e)
+            return False
+        if not data:
+            return False
+        if self.pos:
+            del self.buffer[:self.pos]
+            self.pos = 0
+        self.buffer += data
+        return True
+
+    # returns a text line, a (name, value) tuple, or False if nothing is ready
+    def readline(self):
+        while True:
+            if not self.binary:
+                i = self.buffer.find(b'\n', self.pos)
+                if i < 0:
+                    return False
+                line = self.buffer[self.pos:i+1].decode()
+                self.pos = i+1
+                if line.startswith('framing='):
+                    self.binary = True
+                return line
+
+            if len(self.buffer) - self.pos < header.size:
+                return False
+            kind, id, length = header.unpack_from(self.buffer, self.pos)
+            start = self.pos + header.size
+            end = start + length
+            if end > len(self.buffer):
+                return False
+            self.pos = end
+
+            if kind == FRAME_FLOAT:
+                return self.names[id], struct.unpack_from('<d', self.buffer, start)[0]
+            if kind == FRAME_FLOATS:
+                return self.names[id], list(struct.unpack_from('<%dd' % (length//8), self.buffer, start))
+            data = self.buffer[start:end].decode()
+            if kind == FRAME_JSON:
+                return self.names[id], pyjson.loads(data)
+            if kind == FRAME_TEXT:
+                return data
+            if kind == FRAME_NAME:
+                self.names[id] = data
+            else:
+                print(_('invalid frame from server:'), kind, id)
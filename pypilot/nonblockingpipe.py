@@ -8,6 +8,7 @@
 # version 3 of the License, or (at your option) any later version.  
 
 import select, time, os
+import mmap, struct, zlib
 import pyjson
 
 class NonBlockingPipeEnd(object):
@@ -50,6 +51,9 @@ class NonBlockingPipeEnd(object):
 
     def write(self, value, udp=False):
         self.send(value)
+
+    def write_value(self, name, value, udp=False):
+        self.send(value)
     
     def send(self, value, block=False):
         t0=time.time()
@@ -115,6 +119,7 @@ class PipeNonBlockingPipeEnd(object):
         os.set_blocking(r, False)
         os.set_blocking(w, False)
         self.b = linebuffer.LineBuffer(r)
+        self.out_buffer = bytearray() # only used if the pipe is full
         self.pollout = select.poll()
         self.pollout.register(self.w, select.POLLOUT)
         self.recvfailok = recvfailok
@@ -148,17 +153,41 @@ class PipeNonBlockingPipeEnd(object):
         return False
 
     def flush(self):
-        pass
+        if not self.out_buffer:
+            return
+        try:
+            count = os.write(self.w, self.out_buffer)
+        except BlockingIOError:
+            return
+        del self.out_buffer[:count]
+
+    def write_value(self, name, data, udp=False):
+        self.write(data)
 
     def write(self, data, udp=False):
-        if not self.pollout.poll(0):
+        data = data.encode()
+        if self.out_buffer: # keep order behind data not yet written
+            self.out_buffer += data
+        else:
+            t0 = time.time()
+            try:
+                count = os.write(self.w, data)
+            except BlockingIOError:
+                count = 0
+            t1 = time.time()
+            if t1-t0 > .04:
+                print('too long write pipe', t1-t0, self.name, len(data))
+            if count == len(data):
+                return True
+            self.out_buffer += memoryview(data)[count:] # write the rest on flush
+
+        if len(self.out_buffer) > 65536:
             if not self.sendfailok:
-                print(_('failed write'), self.name)
-        t0 = time.time()
-        os.write(self.w, data.encode())
-        t1 = time.time()
-        if t1-t0 > .04:
-            print('too long write pipe', t1-t0, self.name, len(data))
+                print(_('failed write'), self.name, len(self.out_buffer))
+            # drop whole lines, the first may be partially written already
+            del self.out_buffer[self.out_buffer.find(b'\n')+1:]
+            return False
+        return True
 
     def send(self, value, block=False, maxdt=.025):
         if 0:
@@ -168,13 +197,13 @@ class PipeNonBlockingPipeEnd(object):
         t0 = time.monotonic()
         try:
             data = pyjson.dumps(value) + '\n'
-            data = data.encode()
             t1 = time.monotonic()
-            os.write(self.w, data)
+            # through the output buffer so lines stay whole and in order
+            sent = self.write(data)
             t2 = time.monotonic()
             if t2-t0 > maxdt:
                 print('too long send nonblocking pipe', t1-t0, t2-t1, self.name, len(data))
-            return True
+            return sent
         except Exception as e:
             if t0 > self.sendfail_time:
                 self.sendfail_time = t0+10
@@ -184,6 +213,125 @@ class PipeNonBlockingPipeEnd(object):
                     print("Warning failed send ex", t0, self.name, e)
             return False
 
+# ring of slots in shared memory written by a single producer process
+# each slot has a sequence number which is odd while the slot is written,
+# the reader copies the record then checks the sequence and a checksum, so
+# torn records (or stores seen out of order) are retried rather than used.
+# A reader which falls a full ring behind skips to the oldest record still
+# in the ring, so it always receives recent data.
+ring_head = struct.Struct('<Q')
+ring_slot = struct.Struct('<QII') # sequence, length, crc
+
+class SharedMemoryRing(object):
+    def __init__(self, slots=16, slot_size=4096):
+        self.slots, self.slot_size = slots, slot_size
+        self.stride = ring_slot.size + slot_size
+        # anonymous shared mapping is inherited by forked processes
+        self.map = mmap.mmap(-1, ring_head.size + slots*self.stride)
+        self.head = 0 # next record to write
+        self.next = 0 # next record to read
+
+    def close(self):
+        self.map.close()
+
+    def slot(self, seq):
+        return ring_head.size + (seq % self.slots)*self.stride
+
+    def write(self, data):
+        l = len(data)
+        if l > self.slot_size:
+            return False
+        seq, o = self.head, self.slot(self.head)
+        ring_slot.pack_into(self.map, o, 2*seq+1, 0, 0)
+        self.map[o+ring_slot.size:o+ring_slot.size+l] = data
+        ring_slot.pack_into(self.map, o, 2*seq+2, l, zlib.crc32(data))
+        self.head = seq+1
+        ring_head.pack_into(self.map, 0, self.head)
+        return True
+
+    def ready(self):
+        return self.next < ring_head.unpack_from(self.map, 0)[0]
+
+    def read(self):
+        head = ring_head.unpack_from(self.map, 0)[0]
+        while self.next < head:
+            if head - self.next >= self.slots: # overrun, skip ahead
+                self.next = head - self.slots + 1
+            seq, o = self.next, self.slot(self.next)
+            s0, l, crc = ring_slot.unpack_from(self.map, o)
+            if l <= self.slot_size:
+                data = self.map[o+ring_slot.size:o+ring_slot.size+l]
+                s1 = ring_slot.unpack_from(self.map, o)[0]
+                if s0 == s1 == 2*seq+2 and zlib.crc32(data) == crc:
+                    self.next = seq+1
+                    return data
+            if s0 <= 2*seq+2:
+                return False # not completely visible yet, try again later
+            head = ring_head.unpack_from(self.map, 0)[0] # overwritten
+            self.next = seq+1
+        return False
+
+# pipe using a shared memory ring in each direction, it avoids system
+# calls entirely but is not pollable, so the reader must poll for data
+# as well as drop data if it falls behind, suitable for sensor data
+class SharedMemoryPipeEnd(object):
+    def __init__(self, out_ring, in_ring, name, recvfailok, sendfailok):
+        self.out_ring, self.in_ring = out_ring, in_ring
+        self.name = name
+        self.recvfailok = recvfailok
+        self.sendfailok = sendfailok
+        self.sendfailcount = 0
+        self.failcountmsg = 1
+
+    def fileno(self):
+        return 0
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.out_ring.close()
+        self.in_ring.close()
+
+    def recvdata(self):
+        return self.in_ring.ready()
+
+    def readline(self):
+        data = self.in_ring.read()
+        if data is False:
+            return False
+        return data.decode()
+
+    def recv(self, timeout=0):
+        line = self.readline()
+        if not line:
+            return
+        try:
+            return pyjson.loads(line)
+        except Exception as e:
+            print(_('failed to decode data socket!'), self.name, e)
+            print('line', line)
+        return False
+
+    def write(self, data, udp=False):
+        self.write_data(data.encode())
+
+    def write_value(self, name, data, udp=False):
+        self.write(data)
+
+    def send(self, value, block=False):
+        return self.write_data(pyjson.dumps(value).encode())
+
+    def write_data(self, data):
+        if self.out_ring.write(data):
+            return True
+        if not self.sendfailok:
+            self.sendfailcount += 1
+            if self.sendfailcount == self.failcountmsg:
+                print(_('failed write'), self.name, len(data))
+                self.failcountmsg *= 10
+        return False
+
 # non multiprocessed pipe emulates functions in a simple queue
 class NoMPLineBufferedPipeEnd(object):
     def __init__(self, name):
@@ -201,6 +349,9 @@ class NoMPLineBufferedPipeEnd(object):
 
     def write(self, data, udp=False):
         self.send(data)
+
+    def write_value(self, name, data, udp=False):
+        self.send(data)
     
     def recv(self, timeout=0):
         return self.readline()
@@ -219,9 +370,13 @@ class NoMPLineBufferedPipeEnd(object):
         return True
         
 
-def NonBlockingPipe(name, use_multiprocessing, recvfailok=True, sendfailok=False):
+def NonBlockingPipe(name, use_multiprocessing, recvfailok=True, sendfailok=False, shared_memory=False):
     if use_multiprocessing:
-        if 1:
+        if shared_memory:
+            # lowest cpu usage for high rate data between forked processes
+            ring0, ring1 = SharedMemoryRing(), SharedMemoryRing()
+            return SharedMemoryPipeEnd(ring0, ring1, name+'[0]', recvfailok, sendfailok), SharedMemoryPipeEnd(ring1, ring0, name+'[1]', recvfailok, sendfailok)
+        elif 1:
             # os pipe has lowest cpu usage
             r0, w0 = os.pipe()
             r1, w1 = os.pipe()
@@ -0,0 +1,236 @@
+#!/usr/bin/env python
+#
+#   Copyright (C) 2022 Sean D'Epagnier
+#
+# This Program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation; either
+# version 3 of the License, or (at your option) any later version.
+
+# records the values received by the server from their owners to a
+# compact binary log, and replays logs from a server in place of the autopilot
+#
+# a log starts with a magic line and the wall clock time it was started,
+# then records of 32 bit milliseconds since the start, 16 bit id and 16 bit
+# length followed by the json data of the value.  Records with id 0 define
+# the id of a value as [id, name, info] before its first update.
+# Logs are rotated once they reach max_log_size, keeping the latest.
+#
+#    pypilot_replay [-x speed] [-n prefix]... pypilot.rec.1 pypilot.rec
+
+import os, sys, time, struct, threading, queue, tempfile
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import gettext_loader
+import pyjson
+from values import Value
+
+magic = b'pypilot record 1\n'
+header = struct.Struct('<d')
+record = struct.Struct('<IHH')
+max_log_size = 16*1024*1024
+max_logs = 8 # rotated logs kept
+
+# while recording, the server adds the recorder as a connection
+# watching every value so owners send each update
+class Recorder(threading.Thread):
+    def __init__(self, filename):
+        super(Recorder, self).__init__(daemon=True)
+        self.filename = filename
+        self.queue = queue.Queue()
+        self.begin(time.monotonic())
+        self.write_time = 0
+
+    # a log is only readable from its start, so each has its own ids
+    def begin(self, t):
+        self.t0 = t
+        self.ids = {}
+        self.size = 0
+        self.buffer = bytearray(magic + header.pack(time.time()))
+
+    def record(self, t, value, msg):
+        id = self.ids.get(value.name)
+        if not id:
+            id = len(self.ids) + 1
+            self.ids[value.name] = id
+            self.add(t, 0, pyjson.dumps([id, value.name, value.info]).encode())
+        self.add(t, id, msg[len(value.name)+1:].rstrip().encode())
+
+    def write_value(self, name, msg, udp=False):
+        pass # updates are recorded as the server receives them
+
+    def add(self, t, id, data):
+        if len(data) > 65535:
+            return # too large for a record
+        self.buffer += record.pack(int((t - self.t0)*1000), id, len(data))
+        self.buffer += data
+
+    # hand recorded data to the writer thread once a second
+    def poll(self, t):
+        if t - self.write_time < 1:
+            return
+        self.write_time = t
+        self.queue.put(self.buffer)
+        self.size += len(self.buffer)
+        self.buffer = bytearray()
+        if self.size >= max_log_size:
+            self.queue.put('rotate')
+            self.begin(t)
+
+    def close(self):
+        self.queue.put(self.buffer)
+        self.queue.put(None)
+        self.join()
+
+    def rotate(self):
+        for i in range(max_logs - 1, 0, -1):
+            name = self.filename + ('.%d' % (i-1) if i > 1 else '')
+            if os.path.exists(name):
+                os.rename(name, self.filename + '.%d' % i)
+
+    def run(self):
+        file = False
+        while True:
+            data = self.queue.get()
+            try:
+                if data is None or data == 'rotate':
+                    if file:
+                        file.close()
+                        file = False
+                    if data is None:
+                        break
+                    continue
+                if not file:
+                    self.rotate() # keep the previous log
+                    file = open(self.filename, 'wb')
+                file.write(data)
+                file.flush()
+            except Exception as e:
+                print(_('failed to write'), self.filename, e)
+
+# yields the wall clock time, name, info and json data of each recorded update
+def read_log(filename):
+    f = open(filename, 'rb')
+    if f.read(len(magic)) != magic:
+        f.close()
+        raise ValueError(_('not a pypilot record') + ' ' + filename)
+    start, = header.unpack(f.read(header.size))
+    names = {}
+    while True:
+        data = f.read(record.size)
+        if len(data) < record.size:
+            break
+        ms, id, length = record.unpack(data)
+        data = f.read(length)
+        if len(data) < length:
+            break # partial record from losing power during a write
+        if id == 0:
+            id, name, info = pyjson.loads(data)
+            names[id] = name, info
+        else:
+            name, info = names[id]
+            yield start + ms / 1000, name, info, data.decode()
+    f.close()
+
+# a replayed value sends the recorded json data as is
+class ReplayValue(Value):
+    def __init__(self, name, info, data):
+        super(ReplayValue, self).__init__(name, None)
+        self.info = info
+        self.value = data
+
+    def get_msg(self):
+        return self.value
+
+    def set(self, value): # from the server when another client sets it
+        super(ReplayValue, self).set(pyjson.dumps(value))
+
+    def replay(self, data):
+        super(ReplayValue, self).set(data)
+
+def matches(name, prefixes):
+    if not prefixes:
+        return True
+    for prefix in prefixes:
+        if name.startswith(prefix):
+            return True
+    return False
+
+# serves the recorded values from a server of its own, registering them
+# through a pipe as the autopilot does, and sends their updates with the
+# recorded timing divided by speed
+class Replay(object):
+    def __init__(self, server, filenames, speed=1, prefixes=False):
+        from client import pypilotClient
+        self.server = server
+        self.client = pypilotClient(server)
+        self.values = {}
+        for filename in filenames:
+            for t, name, info, data in read_log(filename):
+                if not name in self.values and matches(name, prefixes):
+                    self.values[name] = self.client.register(ReplayValue(name, info, data))
+        self.speed = speed
+        self.records = self.read(filenames)
+        self.record = next(self.records, None)
+        self.start = False
+
+    def read(self, filenames):
+        for filename in filenames:
+            for t, name, info, data in read_log(filename):
+                if name in self.values:
+                    yield t, name, data
+
+    # send the updates which are due, returns False once all are sent
+    def poll(self):
+        t0 = time.monotonic()
+        dt = .1
+        while self.record:
+            t, name, data = self.record
+            if not self.start:
+                self.start = t, t0
+            dt = self.start[1] + (t - self.start[0]) / self.speed - t0
+            if dt > 0:
+                break
+            self.values[name].replay(data)
+            self.record = next(self.records, None)
+        dt = min(dt, .1)
+        self.server.poll(dt)
+        self.client.poll(dt)
+        return bool(self.record)
+
+def main():
+    if '-h' in sys.argv or len(sys.argv) < 2:
+        print(_('usage'), sys.argv[0], '[-x speed] [-n prefix]... FILE...')
+        print('eg:', sys.argv[0], '-x 10 -n imu. ~/.pypilot/pypilot.rec')
+        print('-x', _('replay faster by this factor'))
+        print('-n', _('only replay values starting with prefix'))
+        print('-h', _('show this message'))
+        exit(0)
+
+    args = list(sys.argv)[1:]
+    speed, prefixes, filenames = 1, [], []
+    while args:
+        arg = args.pop(0)
+        if arg == '-x':
+            speed = float(args.pop(0))
+        elif arg == '-n':
+            prefixes.append(args.pop(0))
+        else:
+            filenames.append(arg)
+
+    # replayed values are not stored, nor recorded over the logs being
+    # replayed, as the server keeps its configuration in a temporary directory
+    import server
+    server.configfilepath = tempfile.mkdtemp(prefix='pypilot_replay') + '/'
+    replay = Replay(server.pypilotServer(), filenames, speed, prefixes)
+    try:
+        while replay.poll():
+            pass
+        t0 = time.monotonic()
+        while time.monotonic() - t0 < 1: # let the server send the last updates
+            replay.poll()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main()
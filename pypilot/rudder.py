@@ -15,7 +15,7 @@ class Rudder(Sensor):
     def __init__(self, client):
         super(Rudder, self).__init__(client, 'rudder')
 
-        self.angle = self.register(SensorValue, 'angle')
+        self.angle = self.register(SensorValue, 'angle', history=True)
         self.speed = self.register(SensorValue, 'speed')
         self.last = 0
         self.last_time = time.monotonic()
@@ -7,23 +7,116 @@
 # License as published by the Free Software Foundation; either
 # version 3 of the License, or (at your option) any later version.  
 
-import select, socket, time
-import sys, os, heapq
+import select, socket, time, errno, re
+import sys, os, itertools
 
-import numbers
+import numbers, math
+from array import array
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 import gettext_loader
 import pyjson
 from bufferedsocket import LineBufferedNonBlockingSocket
-from nonblockingpipe import NonBlockingPipe
+from nonblockingpipe import NonBlockingPipe, NoMPLineBufferedPipeEnd
+from timerwheel import TimerWheel
+from configjournal import ConfigJournal, write_config, compact_entries
+from recorder import Recorder
+import framing
 
 DEFAULT_PORT = 23322
+unix_socket_name = '\0pypilot' # abstract unix socket for clients on this host
+multicast_group = '239.255.23.22' # values selected by the multicast value are sent here
+multicast_packet_size = 1400 # stay below the ethernet mtu
 from zeroconf_service import zeroconf
 max_connections = 30
 configfilepath = os.getenv('HOME') + '/.pypilot/'
 configfilename = 'pypilot.conf'
 server_persistent_period = 60 # store data every 60 seconds
 use_multiprocessing = True # run server in a separate process
+value_ids = itertools.count(1) # ids for binary framing, 0 is reserved
+history_period = .1 # values with history are tracked at least this often
+history_size = 1200 # samples of history kept, 2 minutes at history_period
+max_history_reply = 16000 # bytes, clients read lines of at most 16384 bytes
+
+# checkers validate the json of a write from the type of its value,
+# returning the value, without parsing the json in most cases
+json_number = re.compile(r'-?(0|[1-9][0-9]*)(\.[0-9]+)?([eE][+-]?[0-9]+)?')
+
+# float of json number text, float() also accepts nan, 1_0 and spaces
+def json_float(data):
+    if not json_number.fullmatch(data):
+        raise ValueError('not a number')
+    return float(data)
+
+def range_checker(info):
+    min_value, max_value = info['min'], info['max']
+    def check(data):
+        value = json_float(data)
+        if not min_value <= value <= max_value:
+            raise ValueError('out of range')
+        return value
+    return check
+
+def enum_checker(info):
+    choices = set(str(choice) for choice in info['choices'])
+    numbers = set()
+    for choice in info['choices']:
+        try: # floating point equivalent is accepted, 10.0 is 10
+            numbers.add(float(choice))
+        except ValueError:
+            pass
+    def check(data):
+        if data.startswith('"'):
+            value = pyjson.loads(data) if '\\' in data else data[1:-1]
+            if not value in choices or not data.endswith('"'):
+                raise ValueError('invalid choice')
+            return value
+        if json_float(data) in numbers:
+            return pyjson.loads(data)
+        raise ValueError('invalid choice')
+    return check
+
+def boolean_check(data):
+    if data == 'true':
+        return True
+    if data == 'false':
+        return False
+    return bool(json_float(data))
+
+def value_checker(info):
+    if 'min' in info and 'max' in info:
+        return range_checker(info)
+    if 'choices' in info:
+        return enum_checker(info)
+    if info.get('type') == 'BooleanProperty':
+        return boolean_check
+    return pyjson.loads
+
+# epoll on linux, otherwise fall back to poll
+class ServerPoller(object):
+    def __init__(self):
+        try:
+            self.poller = select.epoll()
+            self.scale = .001 # epoll timeout is in seconds
+            self.edge = select.EPOLLET
+        except AttributeError:
+            self.poller = select.poll()
+            self.scale = 1
+            self.edge = 0
+
+    def register(self, fd, edge=False):
+        flags = select.POLLIN
+        if edge:
+            flags |= self.edge
+        self.poller.register(fd, flags)
+
+    def unregister(self, fd):
+        try:
+            self.poller.unregister(fd)
+        except (OSError, KeyError): # closed fd was already removed
+            pass
+
+    def poll(self, timeout):
+        return self.poller.poll(timeout * self.scale)
 
 class Watch(object):
     def __init__(self, value, connection, period):
@@ -31,6 +124,176 @@ class Watch(object):
         self.connections = [connection]
         self.period = period
         self.time = 0
+        self.aggregate = False
+
+    def get_msg(self):
+        return self.value.get_msg()
+
+# apply f to numbers or element-wise to lists of numbers
+def combine(f, a, b):
+    if isinstance(a, list):
+        return [f(x, y) for x, y in zip(a, b)]
+    return f(a, b)
+
+# start, step and result of each aggregate
+aggregates = {'mean': (lambda x: x, lambda a, x: a + x, lambda a, n: a / n),
+              'rms': (lambda x: x*x, lambda a, x: a + x*x, lambda a, n: math.sqrt(a / n)),
+              'min': (lambda x: x, min, lambda a, n: a),
+              'max': (lambda x: x, max, lambda a, n: a)}
+
+# directions are averaged as unit vectors, in degrees from 0 to 360
+# unless a sample was negative, then from -180 to 180
+def direction_start(x):
+    return math.sin(math.radians(x)), math.cos(math.radians(x)), x < 0
+
+def direction_step(a, x):
+    s, c, negative = direction_start(x)
+    return a[0] + s, a[1] + c, a[2] or negative
+
+def direction_result(a, n):
+    result = math.degrees(math.atan2(a[0], a[1]))
+    if result < 0 and not a[2]:
+        result += 360
+        if result >= 360: # rounded up from a tiny negative angle
+            result -= 360
+    return result
+
+direction_aggregates = {'mean': (direction_start, direction_step, direction_result)}
+
+# periodic watch sending an aggregate of every sample over the period
+# rather than the last sample, the owner sends every sample to the server
+class AggregateWatch(Watch):
+    def __init__(self, value, connection, period, aggregate):
+        super(AggregateWatch, self).__init__(value, connection, period)
+        self.aggregate = aggregate
+        self.count = 0
+        self.acc = None
+
+    def add(self, sample):
+        if self.count:
+            self.acc = combine(self.step, self.acc, sample)
+        else:
+            # the value may have been registered since the watch was added
+            functions = aggregates
+            if self.value.info.get('directional') and self.aggregate in direction_aggregates:
+                functions = direction_aggregates
+            self.start, self.step, self.result = functions[self.aggregate]
+            if isinstance(sample, list):
+                self.acc = [self.start(x) for x in sample]
+            else:
+                self.acc = self.start(sample)
+        self.count += 1
+
+    def get_msg(self):
+        if not self.count: # no new samples
+            return self.value.get_msg()
+        n = self.count
+        if isinstance(self.acc, list):
+            result = [self.result(a, n) for a in self.acc]
+        else:
+            result = self.result(self.acc, n)
+        self.count = 0
+        return self.value.name + '=' + pyjson.dumps(result) + '\n'
+
+# ring buffer of recent samples of a numeric value
+class History(object):
+    def __init__(self, size=history_size):
+        self.times = array('d', bytes(8*size))
+        self.data = array('d', bytes(8*size))
+        self.pos = 0
+        self.count = 0
+
+    def add(self, t, x):
+        self.times[self.pos] = t
+        self.data[self.pos] = x
+        self.pos = (self.pos + 1) % len(self.times)
+        if self.count < len(self.times):
+            self.count += 1
+
+    # times and samples after time t, oldest first
+    def since(self, t):
+        n, k = len(self.times), 0
+        while k < self.count and self.times[(self.pos - 1 - k) % n] > t:
+            k += 1
+        start = (self.pos - k) % n
+        if start + k <= n:
+            return self.times[start:start+k], self.data[start:start+k]
+        end = start + k - n
+        return self.times[start:] + self.times[:end], self.data[start:] + self.data[:end]
+
+# prefix of a name such as imu.* or * for all values, or None if the
+# name is not a prefix, or False for other uses of * such as imu.head*
+def name_prefix(name):
+    if not '*' in name:
+        return None
+    if name == '*':
+        return ''
+    if name.endswith('.*') and not '*' in name[:-2]:
+        return name[:-2]
+    return False
+
+# trie of value names split at '.' used to resolve prefix watches like imu.*
+class WatchTrie(object):
+    def __init__(self):
+        self.children = {}
+        self.value = False
+        self.watches = {} # connection: period of prefix watches at this node
+
+    # node for prefix, created if needed
+    def node(self, prefix):
+        node = self
+        if prefix:
+            for part in prefix.split('.'):
+                if not part in node.children:
+                    node.children[part] = WatchTrie()
+                node = node.children[part]
+        return node
+
+    # node for prefix if it exists, lookups from clients do not grow the trie
+    def find(self, prefix):
+        node = self
+        if prefix:
+            for part in prefix.split('.'):
+                node = node.children.get(part)
+                if not node:
+                    return None
+        return node
+
+    # remove nodes of prefix no longer used by values or watches
+    def prune(self, prefix):
+        if not prefix:
+            return
+        parts = prefix.split('.')
+        nodes = [self]
+        for part in parts:
+            node = nodes[-1].children.get(part)
+            if not node:
+                return
+            nodes.append(node)
+        for part, parent, node in reversed(list(zip(parts, nodes, nodes[1:]))):
+            if node.value or node.watches or node.children:
+                return
+            del parent.children[part]
+
+    def insert(self, value):
+        self.node(value.name).value = value
+
+    def values(self):
+        if self.value:
+            yield self.value
+        for child in self.children.values():
+            yield from child.values()
+
+    # prefix watches which match name, including those of its own node
+    # as the values of a node include its own value
+    def prefix_watches(self, name):
+        node = self
+        yield from node.watches.items()
+        for part in name.split('.'):
+            node = node.children.get(part)
+            if not node:
+                break
+            yield from node.watches.items()
 
 class pypilotValue(object):
     def __init__(self, values, name, info={}, connection=False, msg=False):
@@ -43,16 +306,69 @@ class pypilotValue(object):
 
         self.awatches = [] # all watches
         self.pwatches = [] # periodic watches limited in period
+        self.agwatches = [] # aggregate watches which need every sample
         self.msg = msg
 
+        self.id = next(value_ids)
+        self.frame, self.frame_msg = False, None
+        self.updates = 0 # count of values received from owner
+        self.seq = 0 # sequence number of the last change received from owner
+        self.seq_msg = None # value at seq, kept when the value is not tracked
+        self.control = False # commands such as ap.enabled bypass queued values
+        self.check = pyjson.loads # validates and converts writes from clients
+        self.history = False # or History of recent samples
+
     def get_msg(self):
         return self.msg
-        
+
+    # write msg for this value to a connection in its framing
+    def send(self, connection, msg, udp=False):
+        if connection.framing is False:
+            if self.control and isinstance(connection, LineBufferedNonBlockingSocket):
+                connection.write_priority(self.name, msg, udp)
+            else:
+                connection.write_value(self.name, msg, udp)
+            return
+
+        if self.frame_msg is not msg: # frame is shared by all binary connections
+            data = msg[len(self.name)+1:].rstrip()
+            self.frame = framing.value_frame(self.id, data, self.info.get('type') == 'SensorValue')
+            self.frame_msg = msg
+        if not self.id in connection.framing:
+            name_frame = framing.name_frame(self.id, self.name)
+            if self.control: # queued ahead of the value frame, never replaced
+                connection.write_priority(('name', self.name), name_frame)
+            else:
+                connection.write(name_frame)
+            connection.framing.add(self.id)
+        if self.control:
+            connection.write_priority(self.name, self.frame)
+        else:
+            connection.write_value(self.name, self.frame)
+
+    def send_initial(self, connection):
+        self.send(connection, self.get_msg()) # initial retrieval
+
     def set(self, msg, connection):
         t0 = time.monotonic()
         if self.connection == connection:
             # received new value from owner, inform watchers
             self.msg = msg
+            self.updates += 1
+            changed = msg != self.seq_msg
+            if changed: # the same value keeps its sequence number
+                self.server_values.sequence += 1
+                self.seq = self.server_values.sequence
+                self.seq_msg = msg
+            if self.server_values.recorder and connection: # not values of the server
+                self.server_values.recorder.record(t0, self, msg)
+            if self.agwatches:
+                self.aggregate(msg)
+            if self.history:
+                try:
+                    self.history.add(t0, float(msg[len(self.name)+1:]))
+                except ValueError:
+                    pass # only numbers are recorded
 
             if self.awatches:
                 watch = self.awatches[0]
@@ -61,7 +377,9 @@ class pypilotValue(object):
                         if not connection:
                             print('connection FALSE', self.name)
                             continue
-                        connection.write(msg, True)
+                        if not changed and connection.resume.get(self.name, 0) >= self.seq:
+                            continue # resuming client already has this value
+                        self.send(connection, msg, True)
 
                 for watch in self.pwatches:
                     if t0 >= watch.time:
@@ -74,33 +392,47 @@ class pypilotValue(object):
             if not connection or 'writable' in self.info and self.info['writable']:
                 name, data = msg.rstrip().split('=', 1)
                 try:
-                    pyjson.loads(data) # validate data
-                    self.connection.write(msg)
+                    value = self.check(data) # validate data
                 except Exception as e:
                     print('failed to load ', msg)
+                    if connection:
+                        connection.write('error=invalid value for ' + self.name + ': ' + data + '\n')
+                    return
+                if isinstance(self.connection, NoMPLineBufferedPipeEnd):
+                    self.connection.send((self.name, value)) # owner in this process
+                else:
+                    self.connection.write(msg)
                 self.msg = None
             else: # inform key can not be set arbitrarily
                 connection.write('error='+self.name+' is not writable\n')
 
-    def remove_watches(self, connection):
-        for watch in self.awatches:
-            if connection in watch.connections:
-                watch.connections.remove(connection)
-                if not watch.connections:
-                    self.awatches.remove(watch)
-                    self.calculate_watch_period()
-                break
-            
+    def aggregate(self, msg):
+        try:
+            sample = pyjson.loads(msg[len(self.name)+1:])
+            if isinstance(sample, list):
+                for x in sample:
+                    if not isinstance(x, numbers.Number):
+                        return
+            elif not isinstance(sample, numbers.Number) or isinstance(sample, bool):
+                return
+        except ValueError:
+            return
+        for watch in self.agwatches:
+            watch.add(sample)
+
     def calculate_watch_period(self):
         # find minimum watch period from all watches
         watching = False
         if 'persistent' in self.info and self.info['persistent']:
             watching = server_persistent_period
+        if self.history:
+            watching = history_period
         for watch in self.awatches:
             if len(watch.connections) == 0:
                 print(_('ERROR no connections in watch')) # should never hit
-            if watching is False or watch.period < watching:
-                watching = watch.period
+            period = 0 if watch.aggregate else watch.period
+            if watching is False or period < watching:
+                watching = period
                 
         if watching is not self.watching:
             self.watching = watching
@@ -117,8 +449,11 @@ class pypilotValue(object):
                 watch.connections.remove(connection)
                 if not watch.connections:
                     self.awatches.remove(watch)
-                    if recalc and watch.period is self.watching:
+                    if watch.aggregate:
+                        self.agwatches.remove(watch)
+                    if recalc and (watch.period is self.watching or watch.aggregate):
                         self.calculate_watch_period()
+                del connection.watched[self.name]
                 return True
         return False
             
@@ -128,28 +463,49 @@ class pypilotValue(object):
             return
         
         if period is False: # period is False: remove watch
+            connection.resume.pop(self.name, None) # sent again if watched again
             if not self.unwatch(connection, True):
                 # inform client there was no watch
                 connection.write('error=cannot remove unknown watch for ' + self.name + '\n')
             return
         
+        aggregate = False
+        if isinstance(period, dict): # such as {"period": 1, "aggregate": "mean"}
+            aggregate = period.get('aggregate')
+            period = period.get('period', 0)
+            if not aggregate in aggregates:
+                connection.write('error=unknown aggregate for ' + self.name + ': ' + str(aggregate) + '\n')
+                return
+            if self.info.get('directional') and not aggregate in direction_aggregates:
+                connection.write('error=' + aggregate + ' of directional value: ' + self.name + '\n')
+                return
+            if not period:
+                aggregate = False # every sample is sent
+
         if period is True:
             period = 0 # True is same as a period of 0, for continuous watch
 
         # unwatch by removing
         watching = self.unwatch(connection, False) # or for server values (self.connection is False)
         if not watching and self.msg and (period >= self.watching or self.connection is False):
-            connection.write(self.get_msg()) # initial retrieval
+            # skip values a resuming client already received unchanged
+            if period or not self.seq or self.seq > connection.resume.get(self.name, 0):
+                self.send_initial(connection)
 
+        connection.watched[self.name] = self
         for watch in self.awatches:
-            if watch.period == period: # already watching at this rate, add connection
+            if watch.period == period and watch.aggregate == aggregate: # already watching at this rate, add connection
                 watch.connections.append(connection)
                 if period > self.watching: # only need to update if period is relaxed
                     self.calculate_watch_period()
                 break
         else:
             # need a new watch for this unique period
-            watch = Watch(self, connection, period)
+            if aggregate:
+                watch = AggregateWatch(self, connection, period, aggregate)
+                self.agwatches.append(watch)
+            else:
+                watch = Watch(self, connection, period)
             if period == 0: # make sure period 0 is always at start of list
                 self.awatches.insert(0, watch)
             else:
@@ -168,6 +524,13 @@ class ServerWatch(pypilotValue):
         watches = pyjson.loads(data)
         values = self.server_values.values
         for name in watches:
+            prefix = name_prefix(name)
+            if prefix is False:
+                connection.write('error=invalid prefix watch: ' + name + '\n')
+                continue
+            if prefix is not None: # prefix watch such as imu.*
+                self.server_values.watch_prefix(prefix, connection, watches[name])
+                continue
             if not name in values:
                 # watching value not yet registered, add it so we can watch it
                 values[name] = pypilotValue(self.server_values, name)
@@ -194,7 +557,7 @@ class ServerUDP(pypilotValue):
             if socket.udp_port and (socket.udp_port == self.msg or not self.msg) and socket.address[0] == connection.address[0]:
                 #print('remove old udp')
                 socket.udp_port = False
-                socket.udp_out_buffer = ''
+                socket.udp_out_buffer.clear()
 
         connection.udp_port = self.msg # output streams on this port
         for c in self.server.sockets:
@@ -205,6 +568,21 @@ class ServerUDP(pypilotValue):
                 c.udp_socket.close()
                 c.udp_port = False
 
+# special server value a client sets to request binary framing
+class ServerFraming(pypilotValue):
+    def __init__(self, values):
+        super(ServerFraming, self).__init__(values, 'framing')
+
+    def set(self, msg, connection):
+        name, data = msg.rstrip().split('=', 1)
+        if pyjson.loads(data) != 'binary' or not isinstance(connection, LineBufferedNonBlockingSocket):
+            connection.write('error=unsupported framing: ' + data + '\n')
+            return
+        if connection.framing is False:
+            connection.write('framing="binary"\n') # last text line
+            connection.framing = set()
+            connection.frame_end = len(connection.out_buffer) # frames follow the text
+
 class ServerProfiles(pypilotValue):
     def __init__(self, values):
         super(ServerProfiles, self).__init__(values, 'profiles', info = {'type': 'Value', 'persistent': True, 'writable': True})
@@ -275,7 +653,6 @@ class ServerProfile(pypilotValue):
 
         self.server_values.values['profiles'].add(strprofile)
 
-        persistent_values = self.server_values.persistent_values
         persistent_data = self.server_values.persistent_data
 
         if not self.profile in persistent_data:
@@ -284,40 +661,391 @@ class ServerProfile(pypilotValue):
         if not strprofile in persistent_data:
             persistent_data[strprofile] = {}
         data = persistent_data[strprofile]
-        for name, value in persistent_values.items():
-            if not value.info.get('profiled'):
-                continue
-            if not name in prev or prev[name] != value.msg:
-                prev[name] = value.msg
-                self.server_values.need_store = True # ensure we store c
+        entries = [] # journal only the profile data which changed
+        for name, value in self.server_values.profiled_values.items():
+            vmsg = value.get_msg()
+            if vmsg and (not name in prev or prev[name] != vmsg):
+                prev[name] = vmsg
+                entries.append((self.profile, vmsg))
 
             if not name in data:
-                vmsg = value.get_msg()  # add this value to profile copying it from previous profile
-                if vmsg:
+                if vmsg: # add this value to profile copying it from previous profile
                     data[name] = vmsg
+                    entries.append((strprofile, vmsg))
                 else:
                     print("PROFILED DATA WITHOUT MSG?  is not tracked?", name)
-            elif data[name] != value.msg:
+            elif data[name] != vmsg:
                 value.set(data[name], False)  # only inform clients of the updated value from profile change if it really did change
+        if entries:
+            self.server_values.journal.append(entries)
         self.msg = 'new' # invalidate
         self.profile = strprofile
         super(ServerProfile, self).set(msg, False) # inform any clients watching this value
                 
+# special server value with the throughput of each connection and value
+class ServerStats(pypilotValue):
+    def __init__(self, values, server):
+        super(ServerStats, self).__init__(values, 'server.stats', info={'type': 'Value'})
+        self.server = server
+        # computed only by poll so reading it never walks every socket and value
+        self.msg = 'server.stats=' + pyjson.dumps({'connections': [], 'values': {}}) + '\n'
+        self.time = time.monotonic()
+        self.socket_counts = {} # counters at the last update to compute rates
+        self.value_counts = {}
+
+    def set(self, msg, connection):
+        connection.write('error=server.stats is not writable\n')
+
+    # update watchers once a second
+    def poll(self, t0):
+        if t0 - self.time >= 1:
+            msg = 'server.stats=' + pyjson.dumps(self.stats(t0)) + '\n'
+            super(ServerStats, self).set(msg, False)
+
+    def stats(self, t0):
+        dt = max(t0 - self.time, .001)
+        self.time = t0
+
+        counts, self.socket_counts = self.socket_counts, {}
+        connections = []
+        for socket in self.server.sockets:
+            bytes_in, bytes_out = counts.get(socket, (socket.bytes_in, socket.bytes_out))
+            self.socket_counts[socket] = socket.bytes_in, socket.bytes_out
+            connections.append({'address': '%s:%d' % socket.address,
+                                'in': round((socket.bytes_in - bytes_in) / dt),
+                                'out': round((socket.bytes_out - bytes_out) / dt),
+                                'queue': len(socket.out_buffer),
+                                'pending': len(socket.pending),
+                                'sendfail': socket.sendfail_cnt,
+                                'throttle': socket.throttle,
+                                'watches': len(socket.watched),
+                                'prefixes': len(socket.prefixes)})
+
+        counts, self.value_counts = self.value_counts, {}
+        values = {}
+        for name, value in self.server_values.values.items():
+            updates = counts.get(name, value.updates)
+            self.value_counts[name] = value.updates
+            fanout = 0
+            for watch in value.awatches:
+                fanout += len(watch.connections)
+            if fanout or value.updates != updates:
+                values[name] = {'rate': round((value.updates - updates) / dt, 2), 'fanout': fanout}
+
+        return {'connections': connections, 'values': values}
+
+# sends updates of the selected values to the multicast group, acting as
+# a connection watching them so each update is sent once for all listeners
+class MulticastSender(object):
+    def __init__(self):
+        self.pending = {}
+        self.socket = False
+        self.sendfail_cnt = 0
+        self.sendfail_msg = 1
+
+    def write(self, data, udp=False):
+        name = data[:data.find('=')]
+        if name != 'error': # no client made a request
+            self.write_value(name, data)
+
+    def write_value(self, name, msg, udp=False):
+        self.pending[name] = msg
+
+    def close(self):
+        if self.socket:
+            self.socket.close()
+            self.socket = False
+        self.pending = {}
+
+    def send(self, data):
+        try:
+            self.socket.sendto(data, (multicast_group, DEFAULT_PORT))
+            self.sendfail_cnt = 0
+            self.sendfail_msg = 1
+        except Exception as e: # such as no network
+            self.sendfail_cnt += 1
+            if self.sendfail_cnt >= self.sendfail_msg:
+                print(_('failed to send multicast'), e, self.sendfail_cnt)
+                self.sendfail_msg *= 10
+
+    def flush(self):
+        if not self.socket:
+            try:
+                self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+                self.socket.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 1)
+            except Exception as e:
+                print(_('failed to create multicast socket'), e)
+                self.close()
+                return
+
+        # pack lines into as few packets as possible
+        data = b''
+        for msg in self.pending.values():
+            msg = msg.encode()
+            if data and len(data) + len(msg) > multicast_packet_size:
+                self.send(data)
+                data = b''
+            data += msg
+        if data:
+            self.send(data)
+        self.pending = {}
+
+# special server value a client sets to {name: seconds} to receive the
+# recorded samples of values with history as times relative to now and values
+class ServerHistory(pypilotValue):
+    def __init__(self, values):
+        super(ServerHistory, self).__init__(values, 'history')
+
+    def set(self, msg, connection):
+        name, data = msg.rstrip().split('=', 1)
+        try:
+            request = pyjson.loads(data)
+            if not isinstance(request, dict):
+                raise Exception('not a dict')
+        except Exception as e:
+            connection.write('error=invalid history request: ' + data + '\n')
+            return
+
+        t0 = time.monotonic()
+        history = {}
+        values = self.server_values.values
+        for name, seconds in request.items():
+            if name in values and values[name].history:
+                times, data = values[name].history.since(t0 - seconds)
+                history[name] = [[round(t - t0, 3) for t in times], [round(x, 4) for x in data]]
+        msg = 'history=' + pyjson.dumps(history) + '\n'
+
+        step = 1
+        while len(msg) > max_history_reply: # drop samples evenly, keeping the latest
+            step = max(step + 1, len(msg) * step // max_history_reply + 1)
+            reduced = {}
+            for name, (times, data) in history.items():
+                start = (len(times) - 1) % step
+                reduced[name] = [times[start::step], data[start::step]]
+            msg = 'history=' + pyjson.dumps(reduced) + '\n'
+
+        # queued with values rather than written, so a large reply waits for the
+        # socket to send earlier data and is never dropped as an overflow
+        if connection.framing is not False:
+            msg = framing.text_frame(msg)
+        connection.write_value('history', msg)
+
+# special server value listing the values to send to the multicast group
+class ServerMulticast(pypilotValue):
+    def __init__(self, values):
+        super(ServerMulticast, self).__init__(values, 'multicast', info = {'type': 'Value', 'persistent': True, 'writable': True})
+        self.sender = MulticastSender()
+        values.add(self.sender)
+        self.msg = 'multicast=[]\n'
+
+    def set(self, msg, connection):
+        name, data = msg.rstrip().split('=', 1)
+        try:
+            names = pyjson.loads(data)
+            if not isinstance(names, list):
+                raise Exception('not a list')
+        except Exception as e:
+            print('invalid multicast', data, e)
+            if connection:
+                connection.write('error=invalid multicast: ' + data + '\n')
+            return
+
+        values = self.server_values.values
+        for name in list(self.sender.watched):
+            if not name in names:
+                values[name].unwatch(self.sender, True)
+        for name in names:
+            if not name in values:
+                # not yet registered, add it so we can watch it
+                values[name] = pypilotValue(self.server_values, name)
+            if not name in self.sender.watched:
+                values[name].watch(self.sender, 0)
+        if not names:
+            self.sender.close()
+        super(ServerMulticast, self).set('multicast=' + pyjson.dumps(names) + '\n', False)
+
+# special server value to record updates from value owners to a log
+class ServerRecord(pypilotValue):
+    def __init__(self, values):
+        super(ServerRecord, self).__init__(values, 'record', info = {'type': 'BooleanProperty', 'persistent': True, 'writable': True})
+        self.msg = 'record=false\n'
+
+    def set(self, msg, connection):
+        name, data = msg.rstrip().split('=', 1)
+        try:
+            record = pyjson.loads(data)
+        except Exception as e:
+            print('invalid record', data, e)
+            return
+        recorder = self.server_values.recorder
+        if record and not recorder:
+            recorder = Recorder(configfilepath + 'pypilot.rec')
+            self.server_values.add(recorder)
+            recorder.start()
+            self.server_values.recorder = recorder
+            for value in list(self.server_values.values.values()):
+                if value.connection:
+                    value.watch(recorder, 0) # owners send every update
+        elif not record and recorder:
+            for value in list(recorder.watched.values()):
+                value.unwatch(recorder, True)
+            recorder.close()
+            self.server_values.recorder = False
+        super(ServerRecord, self).set('record=' + ('true' if record else 'false') + '\n', False)
+
+# collects the values of a snapshot request, acting as a connection
+# watching the values the server is not tracking until their owner sends them
+class Snapshot(object):
+    def __init__(self, connection, timeout):
+        self.connection = connection
+        self.timeout = timeout
+        self.data = {}
+        self.missing = 0
+
+    def write_value(self, name, msg, udp=False):
+        if not name in self.data:
+            self.missing -= 1
+        self.data[name] = msg[len(name)+1:].rstrip()
+
+    def finish(self):
+        for value in list(self.watched.values()):
+            value.unwatch(self, True)
+        msg = 'snapshot={'
+        notsingle = False
+        for name in self.data:
+            if notsingle:
+                msg += ','
+            msg += '"' + name + '":' + self.data[name]
+            notsingle = True
+        self.connection.write(msg + '}\n')
+
+# special server value a client sets to a list of names or prefixes, or true
+# for all values, to receive their current values in one reply without watching them
+class ServerSnapshot(pypilotValue):
+    def __init__(self, values):
+        super(ServerSnapshot, self).__init__(values, 'snapshot')
+        self.pending = []
+
+    def set(self, msg, connection):
+        name, data = msg.rstrip().split('=', 1)
+        names = pyjson.loads(data)
+        values = self.server_values.values
+        if names is True:
+            names = [name for name in values if values[name].info]
+
+        snapshot = Snapshot(connection, time.monotonic() + 1)
+        self.server_values.add(snapshot)
+        for name in names:
+            prefix = name_prefix(name)
+            if prefix is False:
+                connection.write('error=invalid snapshot prefix: ' + name + '\n')
+                continue
+            if prefix is not None: # prefix such as imu.*
+                node = self.server_values.trie.find(prefix)
+                for value in node.values() if node else []:
+                    if not value.name in names:
+                        names.append(value.name)
+                continue
+            value = values.get(name)
+            if not value:
+                continue
+            msg = value.get_msg()
+            if msg:
+                snapshot.data[name] = msg[len(name)+1:].rstrip()
+            elif value.connection and value.connection != connection:
+                value.watch(snapshot, 0) # owner sends the value
+                snapshot.missing += 1
+
+        if snapshot.missing:
+            self.pending.append(snapshot)
+        else:
+            snapshot.finish()
+
+    def poll(self, t0):
+        for snapshot in list(self.pending):
+            if snapshot.missing <= 0 or t0 >= snapshot.timeout:
+                self.pending.remove(snapshot)
+                snapshot.finish()
+
+# special server value a reconnecting client sets to the last sequence marker
+# it received and the names it has values for, those not updated since are not
+# sent again when watched.  Setting it also enables markers for this connection.
+class ServerResume(pypilotValue):
+    def __init__(self, values):
+        super(ServerResume, self).__init__(values, 'resume')
+
+    def set(self, msg, connection):
+        name, data = msg.rstrip().split('=', 1)
+        try:
+            request = pyjson.loads(data)
+            seq = request.get('seq')
+            names = request.get('names', [])
+        except Exception as e:
+            connection.write('error=invalid resume request: ' + data + '\n')
+            return
+
+        connection.resume = {}
+        if seq:
+            try:
+                directory_id, seq = seq.split(':')
+                seq = int(seq)
+            except ValueError:
+                directory_id = None
+            if directory_id == self.server_values.directory_id: # not after server restart
+                for name in names:
+                    connection.resume[name] = seq
+        if connection.seq_time is False:
+            connection.seq_time = time.monotonic()
+
+# special server value a client sets to the version of the values directory
+# it cached, or "" for none, before watching values.  The directory updates
+# it receives are then preceded by their version.
+class ServerValuesVersion(pypilotValue):
+    def __init__(self, values):
+        super(ServerValuesVersion, self).__init__(values, 'values_version')
+
+    def set(self, msg, connection):
+        name, data = msg.rstrip().split('=', 1)
+        try:
+            version = pyjson.loads(data)
+            if not isinstance(version, str):
+                raise Exception('not a string')
+        except Exception as e:
+            connection.write('error=invalid values_version: ' + data + '\n')
+            return
+        connection.values_version = version
+
 class ServerValues(pypilotValue):
     def __init__(self, server):
         super(ServerValues, self).__init__(self, 'values')
         profile = ServerProfile(self)
         profiles = ServerProfiles(self)
+        self.multicast = ServerMulticast(self)
+        self.snapshot = ServerSnapshot(self)
+        self.stats = ServerStats(self, server)
         
-        self.persistent_values = {'profile': profile, 'profiles': profiles}
-        self.values = {'values': self, 'watch': ServerWatch(self), 'udp_port': ServerUDP(self, server)}
+        self.recorder = False
+        self.persistent_values = {'profile': profile, 'profiles': profiles, 'multicast': self.multicast, 'record': ServerRecord(self)}
+        self.profiled_values = {} # values stored separately for each profile
+        self.values = {'values': self, 'watch': ServerWatch(self), 'udp_port': ServerUDP(self, server), 'framing': ServerFraming(self), 'snapshot': self.snapshot, 'server.stats': self.stats, 'history': ServerHistory(self), 'resume': ServerResume(self), 'values_version': ServerValuesVersion(self)}
         self.values.update(self.persistent_values)
+        self.trie = WatchTrie()
+        for value in self.persistent_values.values():
+            self.trie.insert(value)
+        self.trie.insert(self.stats)
         self.pipevalues = {}
         self.msg = 'new'
+        # the directory only grows while the server runs, clients which cached
+        # it send back its version to receive only the values added since
+        self.directory_id = os.urandom(4).hex()
+        self.directory = [] # names in order of registration
+        self.sequence = 0 # counts updates from owners, the markers sent to resuming clients
         self.persistent_timeout = time.monotonic() + server_persistent_period
         self.need_store = False
+        self.journal = ConfigJournal(configfilepath + configfilename)
         self.load()
-        self.pqwatches = [] # priority queue of watches
+        self.journal.start()
+        self.wheel = TimerWheel() # periodic watches waiting to be sent
         self.last_send_watches = 0
 
     def get_msg(self):
@@ -336,24 +1064,68 @@ class ServerValues(pypilotValue):
             #print('values len', len(self.msg))
         return self.msg
 
+    def version(self):
+        return self.directory_id + ':' + str(len(self.directory))
+
+    # queue a marker after the pending values, so a client that received it
+    # has every update of its continuous watches up to this sequence number
+    def send_seq(self, connection):
+        if self.sequence == connection.seq_sent:
+            return # nothing changed since the last marker
+        connection.seq_sent = self.sequence
+        line = 'seq="' + self.directory_id + ':' + str(self.sequence) + '"\n'
+        if connection.framing is not False:
+            line = framing.text_frame(line)
+        connection.pending.pop('seq', None) # must follow updates queued since
+        connection.pending['seq'] = line
+
+    # names registered since version, or None if the version is not from this server
+    def directory_since(self, version):
+        try:
+            directory_id, count = version.split(':')
+            count = int(count)
+        except ValueError:
+            return None
+        if directory_id != self.directory_id or count > len(self.directory):
+            return None
+        return list(dict.fromkeys(self.directory[count:]))
+
+    def send_initial(self, connection):
+        version = connection.values_version
+        if version is False:
+            super(ServerValues, self).send_initial(connection)
+            return
+        connection.values_version = self.version() # sent with further updates
+        connection.write('values_version="' + connection.values_version + '"\n')
+        names = self.directory_since(version)
+        if names is None:
+            super(ServerValues, self).send_initial(connection)
+        elif names:
+            values = {}
+            for name in names:
+                values[name] = self.values[name].info
+            connection.write('values=' + pyjson.dumps(values) + '\n')
+
     def sleep_time(self):
-        # sleep until the first value in heap is ready
-        if not self.pqwatches:
+        # sleep until the first watch is ready, the server sleeps at most .4 seconds
+        t = self.wheel.next_time(.4)
+        if t is None:
             return None
-        return self.pqwatches[0][0] - time.monotonic()
+        return t - time.monotonic()
             
     def send_watches(self):
         t0 = time.monotonic()
-        while self.pqwatches:
-            if t0 < self.pqwatches[0][0]:
-                break # no more are ready
-            t, i, watch = heapq.heappop(self.pqwatches) # pop first element
+        if self.snapshot.pending:
+            self.snapshot.poll(t0)
+        if self.stats.awatches:
+            self.stats.poll(t0)
+        for watch in self.wheel.expire(t0):
             if not watch.connections:
                 continue # forget this watch
-            msg = watch.value.get_msg()
+            msg = watch.get_msg()
             if msg:
                 for connection in watch.connections:
-                    connection.write(msg, True)
+                    watch.value.send(connection, msg, True)
 
             watch.time += watch.period
             if watch.time < t0:
@@ -361,15 +1133,51 @@ class ServerValues(pypilotValue):
             watch.value.pwatches.append(watch) # put back on value periodic watch list
             
     def insert_watch(self, watch):
-        heapq.heappush(self.pqwatches, (watch.time, time.monotonic(), watch))
+        self.wheel.insert(watch)
+
+    def add(self, connection, cwatches={}):
+        connection.cwatches = dict(cwatches)
+        connection.framing = False
+        connection.owned = {} # values registered by this connection
+        connection.watched = {} # values this connection watches
+        connection.prefixes = {} # trie nodes this connection has prefix watches on
+        connection.values_version = False # directory updates include the version
+        connection.resume = {} # sequence number of values received before reconnecting
+        connection.seq_time = False # or time to send the next sequence marker
+        connection.seq_sent = 0
 
     def remove(self, connection):
-        for name in self.values:
-            value = self.values[name]
+        for value in connection.owned.values():
             if value.connection == connection:
                 value.connection = False
-                continue
-            value.remove_watches(connection)
+        connection.owned = {}
+        for value in list(connection.watched.values()):
+            value.unwatch(connection, True)
+        for prefix, node in connection.prefixes.items():
+            del node.watches[connection]
+            self.trie.prune(prefix)
+        connection.prefixes = {}
+
+    def watch_prefix(self, prefix, connection, period):
+        if period is False:
+            node = self.trie.find(prefix)
+            if not node:
+                return
+            if connection in node.watches:
+                del node.watches[connection]
+                del connection.prefixes[prefix]
+            for value in node.values():
+                if value.name in connection.watched:
+                    value.unwatch(connection, True)
+            self.trie.prune(prefix)
+            return
+
+        node = self.trie.node(prefix)
+        node.watches[connection] = period
+        connection.prefixes[prefix] = node
+        for value in node.values():
+            if value.connection != connection:
+                value.watch(connection, period)
             
     def set(self, msg, connection):
         if isinstance(connection, LineBufferedNonBlockingSocket):
@@ -394,6 +1202,21 @@ class ServerValues(pypilotValue):
             else:
                 value = pypilotValue(self, name, info, connection)
                 self.values[name] = value
+            connection.owned[name] = value
+
+            # values registered later are added to matching prefix watches
+            self.trie.insert(value)
+            for c, period in self.trie.prefix_watches(name):
+                if c != connection and not name in c.watched:
+                    value.watch(c, period)
+            if self.recorder and not name in self.recorder.watched:
+                value.watch(self.recorder, 0)
+
+            value.control = bool(info.get('control'))
+            value.check = value_checker(info)
+            if info.get('history') and not value.history:
+                value.history = History()
+                value.calculate_watch_period()
 
             if info.get('persistent'):
                 # when a persistant value is missing from pypilot.conf
@@ -402,9 +1225,11 @@ class ServerValues(pypilotValue):
                     self.persistent_values[name] = value
 
             if info.get('profiled'):
+                self.profiled_values[name] = value
                 if name in self.persistent_data[None]:
                     del self.persistent_data[None][name]
 
+            self.directory.append(name)
             self.msg = 'new'
 
         msg = False # inform watching clients of updated values
@@ -413,8 +1238,15 @@ class ServerValues(pypilotValue):
                 if c != connection:
                     if not msg:
                         msg = 'values=' + pyjson.dumps(values) + '\n'
+                    if c.values_version is not False:
+                        c.values_version = self.version()
+                        c.write('values_version="' + c.values_version + '"\n')
                     c.write(msg)
 
+    def is_control(self, line):
+        value = self.values.get(line[:line.find('=')])
+        return value and value.control
+
     def HandleRequest(self, msg, connection):
         if msg == '\n':
             return # silently ignore empty line used to poll connection if no data
@@ -425,6 +1257,29 @@ class ServerValues(pypilotValue):
 
         self.values[name].set(msg, connection)
 
+    def load_line(self, profile, name, line):
+        self.persistent_data[profile][name] = line
+        if name in self.values:
+            # loading file while running
+            value = self.values[name]
+            if name != value.name:
+                print("ERROR with values!", name, value.name)
+            if value.msg != line:
+                if profile is None or self.values['profile'].profile == profile:
+                    self.values[name].set(line, False)
+        else:   
+            self.values[name] = pypilotValue(self, name, msg=line)
+            self.persistent_values[name] = self.values[name]
+
+    # apply changes stored after the config file was written
+    def load_journal(self):
+        for profile, line in self.journal.load():
+            if not profile in self.persistent_data:
+                self.persistent_data[profile] = {}
+            self.load_line(profile, line.split('=', 1)[0], line)
+        if self.journal.entries:
+            self.journal.compact(self.persistent_data)
+
     def load_file(self, filename):
         profile = None
         self.persistent_data = {None : {}, 'default' : {}}
@@ -455,18 +1310,7 @@ class ServerValues(pypilotValue):
                     self.persistent_data[profile] = {}
                 continue
 
-            self.persistent_data[profile][name] = line
-            if name in self.values:
-                # loading file while running
-                value = self.values[name]
-                if name != value.name:
-                    print("ERROR with values!", name, value.name)
-                if value.msg != line:
-                    if profile is None or self.values['profile'].profile == profile:
-                        self.values[name].set(line, False)
-            else:   
-                self.values[name] = pypilotValue(self, name, msg=line)
-                self.persistent_values[name] = self.values[name]
+            self.load_line(profile, name, line)
 
         f.close()
         
@@ -497,17 +1341,29 @@ class ServerValues(pypilotValue):
 
             try:
                 self.load_file(configfilepath + configfilename + '.bak')
+                self.load_journal()
                 return
             except Exception as e:
                 print(_('backup data failed as well'), e)
+            self.load_journal()
+            self.need_store = True # write a new config file
             return
 
+        self.load_journal()
         # backup persistent_data if it loaded with success
         self.store_file(configfilepath + configfilename + '.bak')
 
     def poll_config(self, t0):
         if not self.inotify or t0 - self.inotify_time < 5:
             return
+
+        if self.journal.compacted: # watch the new config file
+            self.journal.compacted = False
+            try:
+                self.inotify.remove_watch(configfilepath + configfilename)
+            except Exception as e:
+                print("failed to remove watch", e)
+            self.inotify.add_watch(configfilepath + configfilename)
         
         self.inotify_time = t0
         loaded = False
@@ -517,6 +1373,7 @@ class ServerValues(pypilotValue):
                     if not loaded:
                         print('detected configuration file updated: reloading', configfilename)
                         self.load_file(configfilepath + configfilename)
+                        self.journal.compact(self.persistent_data) # journal is older
                         loaded = True
             except Exception as e:
                 print('pypilot server failed to detect or load config change', e)
@@ -531,24 +1388,14 @@ class ServerValues(pypilotValue):
                 print("failed to remove watch", e)
                 
         print('store_file', filename, '%.3f'%time.monotonic(), self.need_store)
-        file = open(filename, 'w')
-        for name, value in self.persistent_data[None].items():
-            file.write(value)
-        for profile, data in self.persistent_data.items():
-            if profile is None:
-                continue
-            profile.replace('"', '')
-            file.write('[profile="' + profile + '"]\n')
-            for name, value in data.items():
-                if value:
-                    file.write(value)
-        file.close()
+        write_config(filename, self.persistent_data)
 
         if self.inotify:
             self.inotify.add_watch(configfilepath + configfilename)
 
     def store(self):
         self.persistent_timeout = time.monotonic() + server_persistent_period
+        entries = []
         for name in self.persistent_values:
             value = self.persistent_values[name]
             if not value.info.get('persistent'):
@@ -565,14 +1412,15 @@ class ServerValues(pypilotValue):
             if msg and (not name in data or msg != data[name]):
                 #print("need store, changed", name, data[name].rstrip(), msg.rstrip())
                 data[name] = msg
-                self.need_store = name
+                entries.append((profile, msg))
 
-        if self.need_store:
-            try:
-                self.store_file(configfilepath + configfilename)
-                self.need_store = False
-            except Exception as e:
-                print(_('failed to write'), configfilename, e)
+        # the writer thread appends changes to the journal, and rewrites
+        # the config file when the journal is long or data changed otherwise
+        if self.need_store or self.journal.entries + len(entries) > compact_entries:
+            self.journal.compact(self.persistent_data)
+            self.need_store = False
+        elif entries:
+            self.journal.append(entries)
 
 class pypilotServer(object):
     def __init__(self):
@@ -635,18 +1483,32 @@ class pypilotServer(object):
         self.server_socket.listen(5)
         fd = self.server_socket.fileno()
         self.fd_to_connection = {fd: self.server_socket}
-        self.poller = select.poll()
-        self.poller.register(fd, select.POLLIN)
+        self.poller = ServerPoller()
+        self.poller.register(fd, True) # accept until empty so edge triggering is safe
+        self.accept_failed = [] # listeners retried next poll, edges are not repeated
+
+        # local clients avoid the tcp stack with a unix socket
+        try:
+            self.unix_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.unix_socket.setblocking(0)
+            self.unix_socket.bind(unix_socket_name)
+            self.unix_socket.listen(5)
+            fd = self.unix_socket.fileno()
+            self.fd_to_connection[fd] = self.unix_socket
+            self.poller.register(fd, True)
+        except Exception as e:
+            print(_('pypilot_server: failed to listen on unix socket'), e)
+            self.unix_socket = False
 
         # setup direct pipe clients
         print('server setup has', len(self.pipes), 'pipes')
         for pipe in self.pipes:
             if self.multiprocessing:
                 fd = pipe.fileno()
-                self.poller.register(fd, select.POLLIN)
+                self.poller.register(fd)
                 self.fd_to_connection[fd] = pipe
                 self.fd_to_pipe[fd] = pipe
-            pipe.cwatches = {'values': True} # server always watches client values
+            self.values.add(pipe, {'values': True}) # server always watches client values
         self.initialized = True
         self.zeroconf = zeroconf()
         self.zeroconf.start()
@@ -655,30 +1517,54 @@ class pypilotServer(object):
         if not self.initialized:
             return
         self.values.store()
+        self.values.journal.close()
+        if self.values.recorder:
+            self.values.recorder.close()
         self.server_socket.close()
+        if self.unix_socket:
+            self.unix_socket.close()
         for socket in self.sockets:
             socket.close()
         for pipe in self.pipes:
             pipe.close()
 
+    def AddSocket(self, connection, address):
+        if len(self.sockets) == max_connections:
+            print('pypilot server: ' + _('max connections reached') + '!!!', len(self.sockets))
+            self.RemoveSocket(self.sockets[0]) # dump first socket??
+        socket = LineBufferedNonBlockingSocket(connection, address)
+        print(_('server add socket'), socket.address)
+
+        self.sockets.append(socket)
+        socket.fd = socket.fileno() # remember fd, it is lost once the socket closes
+        self.values.add(socket)
+
+        self.fd_to_connection[socket.fd] = socket
+        self.poller.register(socket.fd)
+
     def RemoveSocket(self, socket):
         print('server remove socket', socket.address)
         self.sockets.remove(socket)
 
-        found = False
-        for fd in self.fd_to_connection:
-            if socket == self.fd_to_connection[fd]:
-                del self.fd_to_connection[fd]
-                self.poller.unregister(fd)
-                found = True
-                break
-
-        if not found:
+        if self.fd_to_connection.get(socket.fd) == socket:
+            del self.fd_to_connection[socket.fd]
+            self.poller.unregister(socket.fd)
+        else:
             print('server error: socket not found in fd_to_connection')
 
         socket.close()
         self.values.remove(socket)
 
+    def HandleSocketRequest(self, line, connection):
+        try:
+            self.values.HandleRequest(line, connection)
+        except Exception as e:
+            connection.write('error=invalid request: ' + line)
+            try:
+                print('invalid request from connection', e, line)
+            except Exception as e2:
+                print('invalid request has malformed string', e, e2)
+
     def poll(self, timeout=0):
         # server is in subprocess
         if self.process != 'server process':
@@ -706,26 +1592,36 @@ class pypilotServer(object):
 
         #timeout = 10
         events = self.poller.poll(timeout)
+        retry, self.accept_failed = self.accept_failed, []
+        for listener in retry: # connections may still wait in the backlog
+            events.append((listener.fileno(), select.POLLIN))
+        deferred = [] # requests from sockets handled after control requests
+        pipes = []
 
         while events:
             event = events.pop()
             fd, flag = event
                                     
-            connection = self.fd_to_connection[fd]
-            if connection == self.server_socket:
-                connection, address = connection.accept()
-                if len(self.sockets) == max_connections:
-                    print('pypilot server: ' + _('max connections reached') + '!!!', len(self.sockets))
-                    self.RemoveSocket(self.sockets[0]) # dump first socket??
-                socket = LineBufferedNonBlockingSocket(connection, address)
-                print(_('server add socket'), socket.address)
-
-                self.sockets.append(socket)
-                fd = socket.fileno()
-                socket.cwatches = {} # {'values': True} # server always watches client values
-
-                self.fd_to_connection[fd] = socket
-                self.poller.register(fd, select.POLLIN)
+            connection = self.fd_to_connection.get(fd)
+            if not connection:
+                continue # removed while handling earlier events
+            if connection == self.server_socket or connection == self.unix_socket:
+                listener = connection
+                while True:
+                    try:
+                        connection, address = listener.accept()
+                    except (BlockingIOError, InterruptedError):
+                        break
+                    except OSError as e:
+                        if e.errno in (errno.ECONNABORTED, errno.ECONNRESET, errno.EPROTO):
+                            continue # closed before accepted, accept the next
+                        if not listener in retry: # print once until accepting again
+                            print(_('failed to accept connection'), e) # such as out of files
+                        self.accept_failed.append(listener)
+                        break
+                    if not isinstance(address, tuple): # unix socket
+                        address = ('127.0.0.1', 0) # local client, port 0 in statistics
+                    self.AddSocket(connection, address)
             elif flag & (select.POLLHUP | select.POLLERR | select.POLLNVAL):
                 if not connection in self.sockets:
                     print(_('internal pipe closed, server exiting'))
@@ -733,28 +1629,37 @@ class pypilotServer(object):
                 self.RemoveSocket(connection)
             elif flag & select.POLLIN:
                 if fd in self.fd_to_pipe:
-                    if not connection.recvdata():
-                        continue
-                    line = connection.readline() # shortcut since poll indicates data is ready
-                    while line:
-                        self.values.HandleRequest(line, connection)                        
-                        line = connection.readline()
+                    if connection.recvdata():
+                        pipes.append(connection) # after control requests
                     continue
                 if not connection.recvdata():
                     self.RemoveSocket(connection)
                     continue
+                lines = []
                 while True:
                     line = connection.readline()
                     if not line:
                         break
-                    try:
-                        self.values.HandleRequest(line, connection)                        
-                    except Exception as e:
-                        connection.write('error=invalid request: ' + line)
-                        try:
-                            print('invalid request from connection', e, line)
-                        except Exception as e2:
-                            print('invalid request has malformed string', e, e2)
+                    connection.bytes_in += len(line)
+                    # control requests ahead of any others from this connection are handled now
+                    if not lines and self.values.is_control(line):
+                        self.HandleSocketRequest(line, connection)
+                    else:
+                        lines.append(line)
+                if lines:
+                    deferred.append((connection, lines))
+
+        for connection, lines in deferred:
+            if not connection in self.sockets:
+                continue # removed while handling earlier events
+            for line in lines:
+                self.HandleSocketRequest(line, connection)
+
+        for pipe in pipes:
+            line = pipe.readline() # shortcut since poll indicates data is ready
+            while line:
+                self.values.HandleRequest(line, pipe)
+                line = pipe.readline()
 
         if not self.multiprocessing:
             # these pipes are not pollable as they are implemented as a simple buffer
@@ -767,24 +1672,30 @@ class pypilotServer(object):
                         
         # send periodic watches
         self.values.send_watches()
+        if self.values.recorder:
+            self.values.recorder.poll(t0)
+        if self.values.multicast.sender.pending:
+            self.values.multicast.sender.flush()
 
-        # send watches
-        for connection in self.sockets + self.pipes:
-            if connection.cwatches:
-                connection.write('watch=' + pyjson.dumps(connection.cwatches) + '\n')
-                connection.cwatches = {}
+        # send watches, only pipes own values
+        for pipe in self.pipes:
+            if pipe.cwatches:
+                pipe.write('watch=' + pyjson.dumps(pipe.cwatches) + '\n')
+                pipe.cwatches = {}
 
         # flush all sockets
+        closed = []
+        t1 = time.monotonic()
         for socket in self.sockets:
+            if socket.seq_time is not False and t1 >= socket.seq_time:
+                socket.seq_time = t1 + 1
+                self.values.send_seq(socket)
             socket.flush()
-        while True:
-            for socket in self.sockets:
-                if not socket.socket:
-                    print(_('server socket closed from flush!!'))
-                    self.RemoveSocket(socket)
-                    break
-            else:
-                break
+            if not socket.socket:
+                closed.append(socket)
+        for socket in closed:
+            print(_('server socket closed from flush!!'))
+            self.RemoveSocket(socket)
                 
         for pipe in self.pipes:
             pipe.flush()
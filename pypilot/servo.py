@@ -173,7 +173,7 @@ class ServoTelemetry(object):
 # a property which records the time when it is updated
 class TimedProperty(Property):
     def __init__(self, name):
-        super(TimedProperty, self).__init__(name, 0)
+        super(TimedProperty, self).__init__(name, 0, control=True)
         self.time = 0
         self.set_time = 0
         self.use_period = True
@@ -252,7 +252,7 @@ class Servo(object):
 
         # power usage
         self.voltage = self.register(SensorValue, 'voltage')
-        self.current = self.register(SensorValue, 'current')
+        self.current = self.register(SensorValue, 'current', history=True)
         self.current.noise = self.register(SensorValue, 'current.noise')
         self.current.lasttime = time.monotonic()
         self.controller_temp = self.register(TimeoutSensorValue, 'controller_temp')
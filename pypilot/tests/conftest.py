@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+#
+#   Copyright (C) 2022 Sean D'Epagnier
+#
+# This Program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation; either
+# version 3 of the License, or (at your option) any later version.
+
+# pypilot modules import each other from their directory
+import os, sys, time, socket
+import pytest
+
+path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(path))
+sys.path.insert(0, path)
+import gettext_loader
+
+try:
+    from pypilot.linebuffer import linebuffer
+except ImportError:
+    linebuffer = False
+
+# server in this process with its data in a temporary directory,
+# pipe clients must be created before it is first polled
+@pytest.fixture
+def server(tmp_path, monkeypatch):
+    if not linebuffer:
+        pytest.skip('linebuffer module is not built')
+    import server, client, aioclient
+    # not the port and socket of a pypilot server running on this host
+    listener = socket.socket()
+    listener.bind(('127.0.0.1', 0))
+    port = listener.getsockname()[1]
+    listener.close()
+    name = '\0pypilot-test-%d' % os.getpid()
+    for module in server, client, aioclient:
+        monkeypatch.setattr(module, 'DEFAULT_PORT', port)
+        monkeypatch.setattr(module, 'unix_socket_name', name)
+    monkeypatch.setenv('HOME', str(tmp_path)) # client config file
+    monkeypatch.setattr(server, 'configfilepath', str(tmp_path) + '/')
+    monkeypatch.setattr(server.zeroconf, 'start', lambda self: None) # not announced
+    s = server.pypilotServer()
+    s.multiprocessing = False
+    yield s
+    if s.initialized:
+        s.initialized = False
+        s.values.journal.close()
+        if s.values.recorder:
+            s.values.recorder.close()
+        for connection in s.sockets:
+            connection.close()
+        s.server_socket.close()
+        if s.unix_socket:
+            s.unix_socket.close()
+
+# poll the server and clients until done returns true or timeout
+def poll(server, clients, timeout=2, done=lambda: False):
+    t0 = time.monotonic()
+    while time.monotonic() - t0 < timeout:
+        server.poll(.05)
+        for client in clients:
+            client.poll()
+        if done():
+            return True
+    return False
+
+# connect a tcp client to the server
+def connect(server, **kwargs):
+    from client import pypilotClient
+    client = pypilotClient('localhost', **kwargs)
+    poll(server, [client], done=lambda: client.connection)
+    return client
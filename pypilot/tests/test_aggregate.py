@@ -0,0 +1,57 @@
+import math
+from types import SimpleNamespace
+
+import pyjson
+from conftest import poll, connect
+from test_resume import RawClient
+from server import AggregateWatch
+
+def aggregate(aggregate, samples, info={}):
+    value = SimpleNamespace(name='x', info=info, get_msg=lambda: 'x=0\n')
+    watch = AggregateWatch(value, False, 1, aggregate)
+    for sample in samples:
+        watch.add(sample)
+    return pyjson.loads(watch.get_msg()[2:])
+
+def angle_near(a, b, tolerance=1e-6):
+    return abs((a - b + 180) % 360 - 180) < tolerance
+
+def test_aggregates():
+    assert aggregate('mean', [1, 2, 6]) == 3
+    assert aggregate('rms', [3, 4]) == math.sqrt(12.5)
+    assert aggregate('min', [3, -4, 2]) == -4
+    assert aggregate('max', [[1, 5], [2, 4]]) == [2, 5]
+    assert aggregate('mean', [350, 10]) == 180 # not directional
+
+def test_directional_mean():
+    directional = {'type': 'SensorValue', 'directional': True}
+    mean = aggregate('mean', [350, 10], directional)
+    assert 0 <= mean < 360 and angle_near(mean, 0)
+    assert angle_near(aggregate('mean', [10, 20], directional), 15)
+    assert angle_near(aggregate('mean', [-170, 170], directional), 180)
+    assert angle_near(aggregate('mean', [-10, -30], directional), -20)
+    assert aggregate('mean', [270], directional) == 270
+
+def test_directional_watch(server):
+    from client import pypilotClient
+    from values import SensorValue
+    owner = pypilotClient(server)
+    heading = owner.register(SensorValue('ap.heading', 0, directional=True))
+    poll(server, [owner], .1)
+
+    raw = RawClient()
+    raw.send('watch={"ap.heading": {"period": 1, "aggregate": "rms"}}\n')
+    poll(server, [owner, raw], .2)
+    assert raw.lines() == ['error=rms of directional value: ap.heading']
+
+    client = connect(server)
+    client.watch('ap.heading', {'period': .5, 'aggregate': 'mean'})
+    received, samples = [], []
+    def update():
+        samples.append(350 if len(samples) % 2 else 10)
+        heading.set(samples[-1])
+        received.extend(client.receive().values())
+        return len(received) > 3
+    poll(server, [owner, client], 3, update)
+    # an odd number of samples in a period moves the mean by a few degrees
+    assert [angle_near(mean, 0, 5) for mean in received[2:]] == [True] * len(received[2:])
@@ -0,0 +1,87 @@
+import asyncio
+
+import aioclient
+from aioclient import pypilotAsyncClient
+
+# a writer to a connection which was lost
+class LostWriter(object):
+    def write(self, data):
+        raise ConnectionResetError('lost connection')
+
+    async def drain(self):
+        pass
+
+    def close(self):
+        pass
+
+def test_keepalive_reconnects(monkeypatch):
+    monkeypatch.setattr(aioclient, 'keepalive_period', .1)
+    monkeypatch.setattr(aioclient, 'reconnect_period', .1)
+
+    async def run():
+        lines = []
+        async def handle(reader, writer):
+            lines.append(await reader.readline())
+        server = await asyncio.start_server(handle, '127.0.0.1', 0)
+        port = server.sockets[0].getsockname()[1]
+
+        client = pypilotAsyncClient('127.0.0.1:%d' % port)
+        client.watches['ap.heading'] = True
+        await client.connect()
+        client.writer = LostWriter()
+        for i in range(20):
+            await asyncio.sleep(.1)
+            if len(lines) > 1:
+                break
+        task = client.task
+        await client.close()
+        server.close()
+        return lines, task
+
+    lines, task = asyncio.run(run())
+    assert not task.done() or task.cancelled()
+    assert lines == [b'watch={"ap.heading": true}\n'] * 2 # watches restored
+
+# run coroutine while polling the server and its pipe clients
+def run_with_server(server, clients, coroutine):
+    async def run():
+        task = asyncio.ensure_future(coroutine)
+        while not task.done():
+            server.poll(0)
+            for client in clients:
+                client.poll()
+            await asyncio.sleep(.01)
+        return task.result()
+    return asyncio.run(asyncio.wait_for(run(), 10))
+
+def test_client(server):
+    from client import pypilotClient
+    from values import SensorValue, RangeProperty
+    owner = pypilotClient(server)
+    heading = owner.register(SensorValue('imu.heading', 1))
+    gain = owner.register(RangeProperty('ap.gain', 1, 0, 2))
+    owner.poll()
+
+    async def run():
+        client = pypilotAsyncClient()
+        await client.connect()
+        await client.watch('imu.heading')
+        received = [await client.__anext__()] # initial value
+        heading.set(2)
+        async for name, value in client:
+            received.append((name, value))
+            break
+        await client.set('ap.gain', 1.5)
+        snapshot = await client.snapshot(['imu.*', 'ap.gain'])
+        invalid = await client.snapshot('imu.*') # not a list, the server replies with an error
+        pending = asyncio.ensure_future(client.history({'imu.heading': 10}))
+        await asyncio.sleep(0) # sent
+        await client.close()
+        return received, snapshot, invalid, await pending
+
+    received, snapshot, invalid, history = run_with_server(server, [owner], run())
+    assert received == [('imu.heading', 1), ('imu.heading', 2)]
+    assert gain.value == 1.5
+    assert snapshot == {'imu.heading': 2, 'ap.gain': 1.5}
+    assert invalid is False
+    assert history is False # closed before the reply
@@ -0,0 +1,103 @@
+import socket, time
+import pytest
+
+from conftest import linebuffer
+import framing
+from framing import FrameReader
+
+def socket_pair():
+    if not linebuffer:
+        pytest.skip('linebuffer module is not built')
+    from bufferedsocket import LineBufferedNonBlockingSocket
+    a, b = socket.socketpair()
+    a.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4096)
+    b.setblocking(0)
+    return LineBufferedNonBlockingSocket(a, 'test'), b
+
+def read_all(sock, reader):
+    received = []
+    for i in range(100):
+        reader.recvdata()
+        line = reader.readline()
+        while line:
+            received.append(line)
+            line = reader.readline()
+        if not sock.out_buffer:
+            return received
+        sock.flush()
+
+def test_priority_text():
+    sock, peer = socket_pair()
+    sock.write('ap.heading="%s"\n' % ('x'*20000))
+    sock.write('ap.heading="%s"\n' % ('y'*20000))
+    sock.flush()
+    assert 0 < len(sock.out_buffer) < 40000 # first line partially sent
+    sock.write_priority('ap.enabled', 'ap.enabled=true\n')
+    sock.flush()
+    lines = read_all(sock, FrameReader(peer))
+    assert [line[:12] for line in lines] == ['ap.heading="', 'ap.enabled=t', 'ap.heading="']
+
+def test_priority_binary():
+    sock, peer = socket_pair()
+    sock.write('framing="binary"\n')
+    sock.framing = set()
+    sock.frame_end = len(sock.out_buffer)
+    sock.write(framing.name_frame(1, 'ap.heading') + framing.name_frame(2, 'ap.enabled'))
+    sock.write(framing.value_frame(1, '"%s"' % ('x'*20000), False))
+    sock.write(framing.value_frame(1, '"%s"' % ('y'*20000), False))
+    sock.flush()
+    assert 0 < len(sock.out_buffer) < 40000 # first frame partially sent
+    sock.write_priority('ap.enabled', framing.value_frame(2, 'true', False))
+    sock.flush()
+    received = read_all(sock, FrameReader(peer))
+    assert received[0] == 'framing="binary"\n'
+    assert [(name, str(value)[:1]) for name, value in received[1:]] == \
+        [('ap.heading', 'x'), ('ap.enabled', 'T'), ('ap.heading', 'y')]
+
+def test_coalesce_values():
+    sock, peer = socket_pair()
+    sock.write('ap.heading="%s"\n' % ('x'*20000))
+    sock.flush()
+    assert sock.out_buffer # earlier data is waiting
+    for i in range(10):
+        sock.write_value('imu.heading', 'imu.heading=%d\n' % i)
+        sock.write_value('imu.pitch', 'imu.pitch=%d\n' % -i)
+        sock.flush()
+    assert list(sock.pending) == ['imu.heading', 'imu.pitch']
+    reader = FrameReader(peer)
+    lines = read_all(sock, reader)
+    sock.flush() # values are sent once the earlier data is
+    lines += read_all(sock, reader)
+    assert not sock.pending
+    assert lines[1:] == ['imu.heading=9\n', 'imu.pitch=-9\n'] # only the latest
+
+def test_throttle():
+    from types import SimpleNamespace
+    from bufferedsocket import update_throttle
+    sock = SimpleNamespace(throttle=0, behind=False, throttle_time=0)
+    throttles = []
+    for behind in [True]*7 + [False]*7:
+        sock.behind = behind
+        update_throttle(sock, 10)
+        throttles.append(sock.throttle)
+    assert throttles[:7] == [.05, .1, .2, .4, .8, 1.6, 1.6] # doubles each second behind
+    assert throttles[7:] == [.8, .4, .2, .1, .05, 0, 0] # halves each second it keeps up
+    assert not sock.behind and sock.throttle_time == 11
+
+def test_throttle_values():
+    sock, peer = socket_pair()
+    sock.throttle = .2
+    sock.throttle_time = time.monotonic() + 10 # not updated while testing
+    reader = FrameReader(peer)
+    lines = []
+    t0 = time.monotonic()
+    for i in range(20): # every 50ms for a second
+        sock.write_value('imu.heading', 'imu.heading=%d\n' % i)
+        sock.flush()
+        lines += read_all(sock, reader)
+        time.sleep(max(t0 + (i+1)*.05 - time.monotonic(), 0))
+    time.sleep(sock.throttle) # the latest is sent after waiting
+    sock.flush()
+    lines += read_all(sock, reader)
+    assert 4 <= len(lines) <= 7 # at most every throttle seconds
+    assert lines[-1] == 'imu.heading=19\n'
@@ -0,0 +1,52 @@
+import pytest
+
+from conftest import poll
+from test_resume import RawClient
+from server import value_checker
+import pyjson
+
+def test_range():
+    check = value_checker({'type': 'RangeProperty', 'min': 0, 'max': 10})
+    assert check('5') == 5.0 and check('10') == 10.0
+    assert check('1e1') == 10.0 and check('-0') == 0 and check('0.5') == .5
+    # accepted by float() but not json, owners would fail to parse them
+    for data in ['11', '-1', 'nan', 'NaN', 'Infinity', '1_0', ' 5', '5 ', '+5', '05', '.5', '"5"', 'true']:
+        with pytest.raises(ValueError):
+            check(data)
+
+def test_enum():
+    check = value_checker({'type': 'EnumProperty', 'choices': ['compass', 'gps', 10]})
+    assert check('"gps"') == 'gps'
+    assert check('"10"') == '10'
+    assert check('10.0') == 10.0
+    assert check('"c\\u006fmpass"') == 'compass' # escaped json
+    for data in ['"wind"', '"gps', '11', '1_0', 'null']:
+        with pytest.raises(ValueError):
+            check(data)
+
+def test_boolean():
+    check = value_checker({'type': 'BooleanProperty'})
+    assert check('true') is True and check('false') is False
+    assert check('1') is True and check('0') is False
+    for data in ['"yes"', 'nan', '1_0', ' 1']:
+        with pytest.raises(ValueError):
+            check(data)
+
+def test_other():
+    assert value_checker({'type': 'Value'}) is pyjson.loads
+
+def test_write_checked(server):
+    from client import pypilotClient
+    from values import RangeProperty, EnumProperty
+    owner = pypilotClient(server)
+    gain = owner.register(RangeProperty('ap.gain', 1, 0, 2))
+    mode = owner.register(EnumProperty('ap.mode', 'compass', ['compass', 'gps']))
+    poll(server, [owner], .1)
+
+    raw = RawClient()
+    raw.send('ap.gain=3\nap.mode="wind"\nap.gain=1_0\nap.mode="gps"\n')
+    assert poll(server, [owner, raw], 2, lambda: mode.value == 'gps')
+    poll(server, [owner, raw], .1)
+    assert gain.value == 1
+    assert raw.lines() == ['error=invalid value for ap.gain: 3', 'error=invalid value for ap.mode: "wind"',
+                           'error=invalid value for ap.gain: 1_0']
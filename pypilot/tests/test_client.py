@@ -0,0 +1,53 @@
+from conftest import poll, connect
+from client import watch_period
+
+def test_watch_period():
+    assert watch_period(True) == 0
+    assert watch_period(0) == 0
+    assert watch_period(.5) == .5
+    assert watch_period({'period': 1, 'aggregate': 'mean'}) == 1
+    assert watch_period({'aggregate': 'max'}) == 0
+    # the fastest request of several sessions
+    requests = [1, {'period': .25, 'aggregate': 'mean'}, True]
+    assert min(requests, key=watch_period) is True
+    assert min(requests[:2], key=watch_period) == requests[1]
+
+def test_receive_queue():
+    from client import pypilotClient
+    client = pypilotClient(False) # not connected
+    for i in range(3):
+        client.receive_value('imu.heading', i)
+        client.receive_value('imu.pitch', -i)
+    assert client.receive_single() == ('imu.heading', 0)
+    assert client.receive() == {'imu.heading': 2, 'imu.pitch': -2} # latest of each
+    assert client.receive_single() is False and not client.received
+
+def test_subscribe(server):
+    from client import pypilotClient
+    from values import SensorValue
+    owner = pypilotClient(server)
+    heading = owner.register(SensorValue('imu.heading', 0))
+    pitch = owner.register(SensorValue('imu.pitch', 0))
+    client = connect(server)
+    received, other = [], []
+    client.subscribe('imu.heading', received.append)
+    client.subscribe('imu.heading', other.append)
+    client.watch('imu.pitch')
+    poll(server, [owner, client], .3)
+    for i in range(1, 4):
+        heading.set(i)
+        pitch.set(i)
+        poll(server, [owner, client], .1)
+    assert received == other == [0, 1, 2, 3]
+    assert client.receive() == {'imu.pitch': 3} # not queued once subscribed
+
+    client.unsubscribe('imu.heading', other.append)
+    heading.set(4)
+    poll(server, [owner, client], .2)
+    assert received == [0, 1, 2, 3, 4] and other == [0, 1, 2, 3]
+    client.unsubscribe('imu.heading', received.append) # no callbacks left, unwatched
+    poll(server, [owner, client], .2)
+    heading.set(5)
+    poll(server, [owner, client], .2)
+    assert received[-1] == 4 and not client.receive()
+    assert not heading.watch
@@ -0,0 +1,44 @@
+import os
+
+from configjournal import ConfigJournal
+
+def test_journal(tmp_path):
+    filename = str(tmp_path / 'pypilot.conf')
+    journal = ConfigJournal(filename)
+    journal.start()
+    journal.append([(None, 'ap.pilot="basic"\n'), ('default', 'ap.P=0.003\n')])
+    journal.append([('default', 'ap.P=0.004\n')])
+    journal.close()
+    with open(filename + '.journal', 'a') as f:
+        f.write('[null, "ap.mo') # lost power during a write
+
+    journal = ConfigJournal(filename)
+    assert journal.load() == [(None, 'ap.pilot="basic"\n'), ('default', 'ap.P=0.003\n'), ('default', 'ap.P=0.004\n')]
+    assert journal.entries == 3
+
+def test_compact(tmp_path, monkeypatch):
+    events = []
+    rename, fsync = os.rename, os.fsync
+    def logged_rename(src, dst):
+        rename(src, dst)
+        events.append('rename ' + os.path.basename(dst))
+    def logged_fsync(fd):
+        fsync(fd)
+        events.append('fsync ' + os.path.basename(os.readlink('/proc/self/fd/%d' % fd)))
+    monkeypatch.setattr(os, 'rename', logged_rename)
+    monkeypatch.setattr(os, 'fsync', logged_fsync)
+
+    filename = str(tmp_path / 'pypilot.conf')
+    journal = ConfigJournal(filename)
+    journal.start()
+    journal.append([(None, 'ap.pilot="basic"\n')])
+    journal.compact({None: {'ap.pilot': 'ap.pilot="simple"\n'}, 'default': {'ap.P': 'ap.P=0.003\n'}})
+    journal.close()
+
+    with open(filename) as f:
+        assert f.read() == 'ap.pilot="simple"\n[profile="default"]\nap.P=0.003\n'
+    assert os.path.getsize(filename + '.journal') == 0
+    assert journal.compacted and journal.entries == 0
+    # the config file and its rename reach the disk before the journal is emptied
+    assert events[1:] == ['fsync pypilot.conf.tmp', 'rename pypilot.conf',
+                          'fsync ' + tmp_path.name, 'fsync pypilot.conf.journal']
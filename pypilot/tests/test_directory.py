@@ -0,0 +1,65 @@
+from conftest import poll, connect
+from test_resume import RawClient
+
+def test_directory_versions(server):
+    from client import pypilotClient
+    from values import SensorValue
+    owner = pypilotClient(server)
+    owner.register(SensorValue('imu.heading', 0))
+    client = connect(server)
+    client.watch('values')
+    poll(server, [owner, client], .3)
+    assert 'imu.heading' in client.values.value
+    version = client.values.version
+    assert version == server.values.version()
+
+    # registered later, only the new value is sent with the new version
+    owner.register(SensorValue('imu.pitch', 0))
+    owner.send(owner.values.get_line())
+    poll(server, [owner, client], .3)
+    assert client.values.version != version
+    assert 'imu.pitch' in client.values.value and 'imu.heading' in client.values.value
+
+    # watching values again sends the changes since the cached version
+    client.watch('values', False)
+    poll(server, [owner, client], .2)
+    client.watch('values')
+    poll(server, [owner, client], .2)
+    assert client.connection
+    assert client.values.version == server.values.version()
+
+    client.disconnect()
+    assert poll(server, [owner, client], 2, lambda: client.connection)
+    poll(server, [owner, client], .3)
+    assert client.values.version == server.values.version()
+    assert {'imu.heading', 'imu.pitch'} <= set(client.values.value)
+
+def test_directory_without_version(server):
+    from client import pypilotClient
+    from values import SensorValue
+    owner = pypilotClient(server)
+    owner.register(SensorValue('imu.heading', 0))
+    poll(server, [owner], .1)
+
+    raw = RawClient() # client which does not cache the directory
+    raw.send('watch={"values": true}\n')
+    poll(server, [owner, raw], .3)
+    lines = raw.lines()
+    assert len(lines) == 1 and lines[0].startswith('values={') and 'imu.heading' in lines[0]
+
+def test_directory_delta_only(server):
+    from client import pypilotClient
+    from values import SensorValue
+    owner = pypilotClient(server)
+    owner.register(SensorValue('imu.heading', 0))
+    poll(server, [owner], .1)
+
+    raw = RawClient()
+    raw.send('values_version="' + server.values.version() + '"\n')
+    raw.send('watch={"values": true}\n')
+    poll(server, [owner, raw], .3)
+    assert raw.lines() == ['values_version="' + server.values.version() + '"']
+
+    raw.send('values_version=5\n')
+    poll(server, [owner, raw], .2)
+    assert raw.lines()[-1].startswith('error=invalid values_version')
@@ -0,0 +1,57 @@
+import itertools, socket
+
+import framing
+from framing import FrameReader
+from conftest import poll, connect
+
+def test_frames():
+    a, b = socket.socketpair()
+    reader = FrameReader(b)
+    id = 70000 # more ids than fit in 16 bits
+    a.send(b'framing="binary"\n' + framing.name_frame(id, 'imu.heading') +
+           framing.value_frame(id, '12.5', True) +
+           framing.value_frame(id, '[1, 2.5]', True) +
+           framing.value_frame(id, '"gps"', True) + # not numeric
+           framing.value_frame(id, '{"a": 1}', False) +
+           framing.text_frame('error=test\n'))
+    reader.recvdata()
+    received = []
+    line = reader.readline()
+    while line is not False:
+        received.append(line)
+        line = reader.readline()
+    assert received == ['framing="binary"\n', ('imu.heading', 12.5), ('imu.heading', [1, 2.5]),
+                        ('imu.heading', 'gps'), ('imu.heading', {'a': 1}), 'error=test\n']
+    a.close()
+    b.close()
+
+def test_large_ids(server, monkeypatch):
+    import server as pypilot_server
+    from client import pypilotClient
+    from values import SensorValue
+    monkeypatch.setattr(pypilot_server, 'value_ids', itertools.count(65534))
+    owner = pypilotClient(server)
+    values = [owner.register(SensorValue('imu.value%d' % i, i)) for i in range(4)]
+    client = connect(server, binary=True)
+    for value in values:
+        client.watch(value.name)
+    received = {}
+    poll(server, [owner, client], 2, lambda: received.update(client.receive()) or len(received) == 4)
+    assert max(server.values.values[value.name].id for value in values) > 65535
+    assert received == {'imu.value%d' % i: i for i in range(4)}
+
+def test_control_value(server):
+    from client import pypilotClient
+    from values import BooleanProperty, SensorValue
+    owner = pypilotClient(server)
+    enabled = owner.register(BooleanProperty('ap.enabled', False, control=True))
+    heading = owner.register(SensorValue('imu.heading', 0))
+    client = connect(server, binary=True)
+    client.watch('imu.heading')
+    poll(server, [owner, client], .2)
+    client.watch('ap.enabled') # the name is sent with the priority value
+    enabled.set(True)
+    heading.set(1)
+    received = {}
+    assert poll(server, [owner, client], 2, lambda: received.update(client.receive()) or received.get('ap.enabled'))
+    assert client.connection
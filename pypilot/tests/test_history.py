@@ -0,0 +1,45 @@
+import time
+
+import pyjson
+from conftest import poll, connect
+from server import History, history_size
+
+def test_history_since():
+    history = History(4)
+    assert list(history.since(0)[0]) == []
+    for t in range(1, 7):
+        history.add(t, t * 10)
+    times, data = history.since(0) # wrapped, oldest first
+    assert list(times) == [3, 4, 5, 6]
+    assert list(data) == [30, 40, 50, 60]
+    times, data = history.since(4.5)
+    assert list(times) == [5, 6]
+
+def test_history_reply(server):
+    from client import pypilotClient
+    from values import SensorValue
+    owner = pypilotClient(server)
+    names = ['imu.heading', 'imu.pitch', 'imu.roll', 'imu.heel']
+    for name in names:
+        owner.register(SensorValue(name, 0, history=True))
+    client = connect(server)
+    poll(server, [owner, client], .2)
+
+    # a full history of every value is larger than the socket buffer
+    t0 = time.monotonic()
+    for name in names:
+        history = server.values.values[name].history
+        assert history
+        for i in range(history_size):
+            history.add(t0 - (history_size - i) * .1, i / 3)
+
+    client.send('history=' + pyjson.dumps({name: 1000 for name in names}) + '\n')
+    received = {}
+    poll(server, [owner, client], done=lambda: received.update(client.receive()) or 'history' in received)
+    history = received['history']
+    assert client.connection
+    assert sorted(history) == sorted(names)
+    times, data = history['imu.heading']
+    assert 100 < len(times) < history_size and len(times) == len(data)
+    assert data[-1] == round((history_size - 1) / 3, 4) # latest sample is kept
+    assert times == sorted(times) and -.2 < times[-1] < 0
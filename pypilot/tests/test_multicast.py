@@ -0,0 +1,80 @@
+import socket, struct
+import pytest
+
+from conftest import poll, connect
+import server as pypilot_server
+from server import MulticastSender
+
+def test_sender_write():
+    sender = MulticastSender()
+    sender.write_value('imu.heading', 'imu.heading=1\n')
+    sender.write('values={"imu.pitch": {"type": "SensorValue"}}\n')
+    sender.write('error=can not add watch for own value: imu.roll\n')
+    assert list(sender.pending) == ['imu.heading', 'values']
+
+class SentSocket(object):
+    def __init__(self, error=False):
+        self.sent = []
+        self.error = error
+
+    def sendto(self, data, address):
+        if self.error:
+            raise OSError(101, 'Network is unreachable')
+        self.sent.append(data)
+
+def test_sender_flush():
+    sender = MulticastSender()
+    sender.socket = SentSocket()
+    sender.flush() # nothing pending
+    sender.write_value('values', 'values={"x": "%s"}\n' % ('x'*2000))
+    sender.write_value('imu.heading', 'imu.heading=1\n')
+    sender.write_value('imu.pitch', 'imu.pitch=2\n')
+    sender.flush()
+    assert [len(data) for data in sender.socket.sent] == [2017, 26] # no empty packets
+
+def test_sender_failed(capsys):
+    sender = MulticastSender()
+    sender.socket = SentSocket(True)
+    for i in range(50):
+        sender.write_value('imu.heading', 'imu.heading=1\n')
+        sender.flush()
+    assert capsys.readouterr().out.count('failed to send multicast') == 2 # 1st and 10th
+
+def test_multicast(server):
+    listener = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+    try:
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        listener.bind(('', pypilot_server.DEFAULT_PORT))
+        group = socket.inet_aton(pypilot_server.multicast_group)
+        listener.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, struct.pack('4sl', group, socket.INADDR_ANY))
+    except OSError as e:
+        listener.close()
+        pytest.skip('no multicast: ' + str(e))
+    listener.setblocking(0)
+
+    from client import pypilotClient
+    from values import SensorValue
+    owner = pypilotClient(server)
+    heading = owner.register(SensorValue('imu.heading', 5))
+    owner.register(SensorValue('imu.pitch', 0))
+    client = connect(server)
+    client.send('multicast=["imu.heading", "values"]\n')
+
+    packets = []
+    def receive():
+        try:
+            while True:
+                packets.append(listener.recv(2000))
+        except BlockingIOError:
+            pass
+        return packets
+    poll(server, [owner, client], 1, lambda: b'imu.heading=' in b''.join(receive()))
+    heading.set(6)
+    poll(server, [owner, client], .3)
+    receive()
+    listener.close()
+    data = b''.join(packets)
+    assert b'imu.heading=5.0000\n' in data # initial value
+    assert b'imu.heading=6.0000\n' in data
+    assert b'values={' in data and b'"imu.pitch"' in data # directory
+    assert not b'imu.pitch=' in data
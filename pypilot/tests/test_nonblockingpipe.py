@@ -0,0 +1,115 @@
+import os, re, time
+import pytest
+
+from conftest import linebuffer
+from nonblockingpipe import NonBlockingPipe
+
+def read(fd):
+    data = b''
+    try:
+        while True:
+            data += os.read(fd, 65536)
+    except BlockingIOError:
+        return data
+
+def test_pipe_overflow():
+    if not linebuffer:
+        pytest.skip('linebuffer module is not built')
+    end0, end1 = NonBlockingPipe('test', True, sendfailok=True)
+    sent = 0
+    def write(count):
+        nonlocal sent
+        for i in range(count):
+            end1.write('value%d="%s"\n' % (sent, 'x'*1000))
+            sent += 1
+
+    write(100) # fill the pipe, then its output buffer
+    data = os.read(end0.r, 10000)
+    end1.flush() # so a line is partially written
+    assert not end1.out_buffer.startswith(b'value')
+    write(70) # overflows
+
+    for i in range(5):
+        data += read(end0.r)
+        end1.flush()
+    end0.close()
+    end1.close()
+
+    lines = data.decode().splitlines(True)
+    assert 60 < len(lines) < sent # some were dropped
+    for line in lines: # but no line is corrupt
+        assert re.fullmatch('value[0-9]+="x{1000}"\n', line)
+    numbers = [int(line[5:line.index('=')]) for line in lines]
+    assert numbers == sorted(numbers)
+
+def test_pipe_send_buffered():
+    if not linebuffer:
+        pytest.skip('linebuffer module is not built')
+    end0, end1 = NonBlockingPipe('test', True, sendfailok=True)
+    for i in range(80): # fill the pipe so a line is partially written
+        end1.write('value%d="%s"\n' % (i, 'x'*1000))
+    assert end1.out_buffer
+    assert end1.send({'imu.heading': 1}) # queued behind the partial line
+    assert end1.out_buffer.endswith(b'{"imu.heading": 1}\n')
+
+    data = b''
+    for i in range(5):
+        data += read(end0.r)
+        end1.flush()
+    end0.close()
+    end1.close()
+
+    lines = data.decode().splitlines()
+    assert lines[:80] == ['value%d="%s"' % (i, 'x'*1000) for i in range(80)]
+    assert lines[80:] == ['{"imu.heading": 1}']
+
+def test_ring():
+    from nonblockingpipe import SharedMemoryRing, ring_slot
+    ring = SharedMemoryRing(slots=4, slot_size=16)
+    assert not ring.ready() and ring.read() is False
+    assert not ring.write(b'x'*17) # too large for a slot
+    for i in range(3):
+        assert ring.write(b'%d' % i)
+    assert [ring.read() for i in range(4)] == [b'0', b'1', b'2', False]
+
+    for i in range(3, 10): # reader falls behind
+        ring.write(b'%d' % i)
+    assert [ring.read() for i in range(4)] == [b'7', b'8', b'9', False] # most recent
+
+    # a record being written is not read until complete
+    o = ring.slot(ring.head)
+    ring.write(b'10')
+    seq, l, crc = ring_slot.unpack_from(ring.map, o)
+    ring_slot.pack_into(ring.map, o, seq-1, l, crc)
+    assert ring.read() is False
+    ring_slot.pack_into(ring.map, o, seq, l, crc+1) # torn data
+    assert ring.read() is False
+    ring_slot.pack_into(ring.map, o, seq, l, crc)
+    assert ring.read() == b'10'
+    ring.close()
+
+def test_shared_memory_pipe():
+    end0, end1 = NonBlockingPipe('test', True, shared_memory=True)
+    pid = os.fork()
+    if not pid: # child sends, then echos a reply
+        for i in range(5):
+            end1.send({'imu.heading': i})
+        t0 = time.monotonic()
+        while time.monotonic() - t0 < 5:
+            value = end1.recv()
+            if value:
+                end1.send(value)
+                break
+        os._exit(0)
+
+    received = []
+    t0 = time.monotonic()
+    while len(received) < 5 and time.monotonic() - t0 < 5:
+        value = end0.recv()
+        if value:
+            received.append(value)
+    assert received == [{'imu.heading': i} for i in range(5)]
+    end0.send(['done'])
+    os.waitpid(pid, 0)
+    assert end0.recv() == ['done']
+    end0.close()
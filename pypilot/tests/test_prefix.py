@@ -0,0 +1,107 @@
+from types import SimpleNamespace
+
+from conftest import poll, connect
+from test_resume import RawClient
+from server import WatchTrie, name_prefix
+
+def test_trie():
+    trie = WatchTrie()
+    values = [SimpleNamespace(name=name) for name in ['imu.heading', 'imu.pitch', 'imu.heading.lowpass', 'ap.mode']]
+    for value in values:
+        trie.insert(value)
+    assert [v.name for v in trie.node('imu').values()] == ['imu.heading', 'imu.heading.lowpass', 'imu.pitch']
+    assert [v.name for v in trie.node('').values()] == [v.name for v in trie.values()]
+    trie.node('imu').watches['a'] = 1
+    trie.node('imu.heading').watches['b'] = 0
+    trie.watches['c'] = True
+    assert list(trie.prefix_watches('imu.heading.lowpass')) == [('c', True), ('a', 1), ('b', 0)]
+    assert list(trie.prefix_watches('imu.pitch')) == [('c', True), ('a', 1)]
+    assert list(trie.prefix_watches('ap.mode')) == [('c', True)]
+    assert list(trie.prefix_watches('imu.heading')) == [('c', True), ('a', 1), ('b', 0)]
+
+def test_trie_find():
+    trie = WatchTrie()
+    trie.insert(SimpleNamespace(name='imu.heading'))
+    assert trie.find('imu').value is False and trie.find('imu.heading').value
+    assert trie.find('imu.pitch') is None and trie.find('ap.mode') is None
+    assert list(trie.children) == ['imu'] and list(trie.find('imu').children) == ['heading']
+    trie.node('ap.mode').watches['a'] = 1
+    trie.prune('ap.mode')
+    assert trie.find('ap.mode')
+    del trie.find('ap.mode').watches['a']
+    trie.prune('ap.mode')
+    trie.prune('imu.heading')
+    assert list(trie.children) == ['imu']
+
+def test_name_prefix():
+    assert name_prefix('imu.*') == 'imu' and name_prefix('*') == ''
+    assert name_prefix('imu.heading') is None
+    for name in ['imu.head*', 'imu*', '*.heading', 'imu.*.*', '**']:
+        assert name_prefix(name) is False
+
+def test_prefix_watch(server):
+    from client import pypilotClient
+    from values import SensorValue
+    owner = pypilotClient(server)
+    heading = owner.register(SensorValue('imu.heading', 1))
+    mode = owner.register(SensorValue('ap.heading', 2))
+    client = connect(server)
+    client.watch('imu.*')
+    received = {}
+    poll(server, [owner, client], .3, lambda: received.update(client.receive()))
+    assert received == {'imu.heading': 1}
+
+    roll = owner.register(SensorValue('imu.roll', 3)) # registered later
+    owner.send(owner.values.get_line())
+    poll(server, [owner, client], .3)
+    heading.set(4)
+    roll.set(5)
+    mode.set(6)
+    received = {}
+    poll(server, [owner, client], .3, lambda: received.update(client.receive()))
+    assert received == {'imu.heading': 4, 'imu.roll': 5}
+
+    client.watch('imu.*', False)
+    poll(server, [owner, client], .3)
+    heading.set(7)
+    poll(server, [owner, client], .3)
+    assert not client.receive()
+    assert not server.values.values['imu.roll'].awatches
+
+def test_invalid_prefix(server):
+    from client import pypilotClient
+    from values import SensorValue
+    owner = pypilotClient(server)
+    owner.register(SensorValue('imu.heading', 1))
+    poll(server, [owner], .1)
+    children = list(server.values.trie.children)
+
+    raw = RawClient()
+    raw.send('watch={"imu.head*": true}\nsnapshot=["imu.head*", "gps.*", "wind.speed.*"]\n')
+    assert poll(server, [owner, raw], 2, lambda: len(raw.lines()) >= 3)
+    lines = raw.lines()
+    assert lines[:2] == ['error=invalid prefix watch: imu.head*', 'error=invalid snapshot prefix: imu.head*']
+    assert lines[2].startswith('snapshot=')
+    assert list(server.values.trie.children) == children # lookups added no nodes
+
+    raw.send('watch={"gps.*": true}\n')
+    poll(server, [owner, raw], .1)
+    assert 'gps' in server.values.trie.children
+    raw.send('watch={"gps.*": false}\n')
+    poll(server, [owner, raw], .1)
+    assert list(server.values.trie.children) == children
+
+def test_own_prefix_watch(server):
+    from client import pypilotClient
+    from values import SensorValue
+    owner = pypilotClient(server)
+    client = connect(server)
+    client.watch('imu.heading.*') # matches imu.heading and values below it
+    poll(server, [owner, client], .1)
+    heading = owner.register(SensorValue('imu.heading', 1))
+    owner.send(owner.values.get_line())
+    poll(server, [owner, client], .3)
+    heading.set(2)
+    received = {}
+    poll(server, [owner, client], .3, lambda: received.update(client.receive()))
+    assert received == {'imu.heading': 2}
@@ -0,0 +1,49 @@
+import os
+
+from conftest import poll, connect
+from configjournal import ConfigJournal
+
+def test_profiles(server):
+    from client import pypilotClient
+    from values import RangeProperty
+    owner = pypilotClient(server)
+    gain = owner.register(RangeProperty('ap.gain', 1, 0, 10, profiled=True))
+    rate = owner.register(RangeProperty('ap.rate', 1, 0, 10, persistent=True))
+    client = connect(server)
+    client.watch('ap.gain')
+    client.watch('ap.rate') # otherwise sent to the server once a minute
+    client.watch('profile')
+    poll(server, [owner, client], .3)
+    assert server.values.profiled_values == {'ap.gain': server.values.values['ap.gain']}
+    server.values.store() # write the new config file
+    filename = server.values.journal.filename
+    assert poll(server, [owner, client], 2, lambda: os.path.exists(filename))
+    config = open(filename).read()
+
+    def switch(profile):
+        client.set('profile', profile)
+        assert poll(server, [owner, client], 2, lambda: server.values.values['profile'].profile == profile)
+        poll(server, [owner, client], .2)
+
+    client.set('ap.gain', 5)
+    assert poll(server, [owner, client], 2, lambda: gain.value == 5)
+    switch('upwind') # new profile starts as a copy
+    assert gain.value == 5
+    client.set('ap.gain', 7)
+    client.set('ap.rate', 3)
+    assert poll(server, [owner, client], 2, lambda: gain.value == 7 and rate.value == 3)
+    switch('default')
+    assert gain.value == 5 and rate.value == 3 # only profiled values change
+    switch('upwind')
+    assert gain.value == 7
+
+    # switching profiles journals only the profile data, not the whole file
+    journal = ConfigJournal(filename)
+    poll(server, [owner, client], 2, lambda: len(journal.load()) >= 3)
+    assert journal.load() == [('default', 'ap.gain=5.0000\n'), ('upwind', 'ap.gain=5.0000\n'),
+                              ('upwind', 'ap.gain=7.0000\n')]
+    assert open(filename).read() == config
+    server.values.store() # other persistent values are journaled periodically
+    assert poll(server, [owner, client], 2, lambda: len(journal.load()) > 3)
+    assert sorted(journal.load()[3:]) == [(None, 'ap.rate=3.0000\n'), (None, 'profile="upwind"\n'),
+                                          (None, 'profiles=["default", "upwind"]\n')]
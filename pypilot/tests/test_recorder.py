@@ -0,0 +1,77 @@
+import time
+from types import SimpleNamespace
+
+from conftest import poll, connect
+from recorder import Recorder, Replay, read_log
+
+heading = SimpleNamespace(name='imu.heading', info={'type': 'SensorValue'})
+mode = SimpleNamespace(name='ap.mode', info={'type': 'EnumProperty', 'choices': ['compass', 'gps']})
+
+def write_log(filename, updates):
+    recorder = Recorder(filename)
+    recorder.start()
+    for dt, value, data in updates:
+        recorder.record(recorder.t0 + dt, value, value.name + '=' + data + '\n')
+    recorder.close()
+
+def test_read_log(tmp_path):
+    filename = str(tmp_path / 'pypilot.rec')
+    write_log(filename, [(0, heading, '1.5'), (.25, mode, '"gps"'), (.5, heading, '2.5')])
+    records = list(read_log(filename))
+    assert [(name, data) for t, name, info, data in records] == \
+        [('imu.heading', '1.5'), ('ap.mode', '"gps"'), ('imu.heading', '2.5')]
+    assert records[1][2] == mode.info
+    assert round(records[2][0] - records[0][0], 3) == .5
+
+def test_read_partial_log(tmp_path):
+    filename = str(tmp_path / 'pypilot.rec')
+    write_log(filename, [(0, heading, '1.5'), (.1, heading, '2.5')])
+    with open(filename, 'rb+') as f:
+        f.truncate(len(f.read()) - 2) # lost power during a write
+    assert [data for t, name, info, data in read_log(filename)] == ['1.5']
+
+def test_replay(server, tmp_path):
+    filename = str(tmp_path / 'pypilot.rec')
+    write_log(filename, [(0, heading, '1'), (.2, heading, '2'), (.4, heading, '3'), (.4, mode, '"gps"')])
+
+    replay = Replay(server, [filename], prefixes=['imu.'])
+    watcher = connect(server)
+    received = []
+    watcher.subscribe('imu.heading', received.append)
+    watcher.watch('ap.mode')
+    poll(server, [watcher, replay.client], .5)
+
+    t0 = time.monotonic()
+    while replay.poll():
+        watcher.poll()
+    poll(server, [watcher, replay.client], .5)
+    assert time.monotonic() - t0 >= .35 # recorded timing
+    assert received == [1, 1, 2, 3] # first when watched, then each recorded update
+    assert not 'ap.mode' in replay.values
+    assert not watcher.receive()
+
+def test_record_unwatched(server, tmp_path):
+    from client import pypilotClient
+    from values import SensorValue
+    owner = pypilotClient(server)
+    clock = owner.register(SensorValue('imu.clock', 0))
+    client = connect(server)
+    poll(server, [owner, client], .2)
+    client.send('record=true\n')
+    poll(server, [owner, client], .2)
+    later = owner.register(SensorValue('imu.later', 0)) # registered while recording
+    owner.send(owner.values.get_line())
+    for i in range(1, 6):
+        clock.set(i)
+        later.set(-i)
+        poll(server, [owner, client], .1)
+    client.send('record=false\n')
+    poll(server, [owner, client], .2)
+    clock.set(6) # not recorded
+
+    updates = [(name, data) for t, name, info, data in read_log(str(tmp_path / 'pypilot.rec'))]
+    # the current value is sent when the recorder starts watching
+    assert [data for name, data in updates if name == 'imu.clock'] == ['%.4f' % i for i in range(6)]
+    assert [data for name, data in updates if name == 'imu.later'][-5:] == ['%.4f' % -i for i in range(1, 6)]
+    assert not server.values.values['imu.clock'].awatches
+    assert not clock.watch and not later.watch
@@ -0,0 +1,78 @@
+import socket
+
+import pyjson
+from conftest import poll, connect
+import server as pypilot_server
+
+# lines received by a raw connection to the server
+class RawClient(object):
+    def __init__(self):
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.socket.connect(pypilot_server.unix_socket_name)
+        self.socket.setblocking(0)
+        self.data = b''
+
+    def poll(self):
+        try:
+            self.data += self.socket.recv(65536)
+        except BlockingIOError:
+            pass
+
+    def send(self, line):
+        self.socket.send(line.encode())
+
+    def lines(self):
+        return self.data.decode().splitlines()
+
+def test_resume(server):
+    from client import pypilotClient
+    from values import SensorValue, EnumProperty
+    owner = pypilotClient(server)
+    heading = owner.register(SensorValue('imu.heading', 10))
+    state = owner.register(EnumProperty('ap.state', 'idle', ['idle', 'tack']))
+    owner.register(EnumProperty('ap.mode', 'compass', ['compass', 'gps']))
+
+    client = connect(server, resume=True)
+    for name in ['imu.heading', 'ap.state', 'ap.mode']:
+        client.watch(name)
+    names = {'imu.heading', 'ap.state', 'ap.mode'}
+    assert poll(server, [owner, client], 3, lambda: set(client.resume_names) == names)
+
+    # the client was the only watcher, so the owner stops sending
+    client.disconnect()
+    poll(server, [owner], .2)
+    assert not state.watch
+    heading.set(20)
+
+    raw = RawClient()
+    request = {'seq': client.resume_seq, 'names': list(names)}
+    raw.send('resume=' + pyjson.dumps(request) + '\n')
+    raw.send('watch={"imu.heading": true, "ap.state": true}\n')
+    poll(server, [owner, raw], .5)
+    raw.send('watch={"ap.mode": true}\n') # later watches are resumed too
+    poll(server, [owner, raw], .5)
+    lines = raw.lines()
+    assert 'imu.heading=20.0000' in lines # changed while disconnected
+    assert not [line for line in lines if line.startswith('ap.')]
+
+    state.set('tack')
+    raw.send('watch={"ap.mode": false}\n')
+    poll(server, [owner, raw], .3)
+    raw.send('watch={"ap.mode": true}\n') # sent after watching again
+    poll(server, [owner, raw], .3)
+    lines = raw.lines()
+    assert 'ap.state="tack"' in lines
+    assert 'ap.mode="compass"' in lines
+
+def test_resume_other_server(server):
+    from client import pypilotClient
+    from values import SensorValue
+    owner = pypilotClient(server)
+    owner.register(SensorValue('imu.heading', 10))
+    poll(server, [owner], .1)
+
+    raw = RawClient()
+    raw.send('resume={"seq": "00000000:100", "names": ["imu.heading"]}\n')
+    raw.send('watch={"imu.heading": true}\n')
+    poll(server, [owner, raw], .5)
+    assert 'imu.heading=10.0000' in raw.lines()
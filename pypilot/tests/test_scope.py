@@ -0,0 +1,26 @@
+import pytest
+
+pytest.importorskip('numpy')
+pytest.importorskip('OpenGL.GLUT')
+from ui.scope import pypilotPlot
+
+def test_history_after_live_data():
+    plot = pypilotPlot()
+    plot.value_list = {'ap.heading': {'type': 'SensorValue'}}
+    plot.width = 1000
+    plot.read_data(('timestamp', 100))
+    plot.read_data(('ap.heading', 5))
+    assert plot.add_history({'ap.heading': [[-2, -1, 0], [1, 2, 3]]})
+    plot.read_data(('timestamp', 101))
+    plot.read_data(('ap.heading', 6))
+    assert plot.traces[0].points == [(101, 6), (100, 5), (99, 2), (98, 1)]
+
+def test_history_before_live_data():
+    plot = pypilotPlot()
+    plot.value_list = {}
+    plot.width = 1000
+    assert not plot.add_history({'ap.heading': [[-1], [1]]}) # no timestamp yet
+    plot.read_data(('timestamp', 100))
+    assert plot.add_history({'ap.heading': [[-2, -1], [1, 2]]})
+    plot.read_data(('ap.heading', 3))
+    assert plot.traces[0].points == [(100, 3), (99, 2), (98, 1)]
@@ -0,0 +1,57 @@
+import errno, os, socket
+from conftest import poll, connect
+
+# listening socket whose next accepts fail
+class FailingListener(object):
+    def __init__(self, listener, error, count):
+        self.listener = listener
+        self.error = error
+        self.count = count
+
+    def fileno(self):
+        return self.listener.fileno()
+
+    def accept(self):
+        if self.count:
+            self.count -= 1
+            raise self.error
+        return self.listener.accept()
+
+    def close(self):
+        self.listener.close()
+
+def fail_accept(server, error, count=1):
+    poll(server, [], .1) # listening
+    listener = FailingListener(server.unix_socket, OSError(error, os.strerror(error)), count)
+    server.unix_socket = listener # local clients connect here
+    server.fd_to_connection[listener.fileno()] = listener
+
+def test_accept_aborted(server):
+    from client import pypilotClient
+    fail_accept(server, errno.ECONNABORTED)
+    client = pypilotClient('localhost')
+    # listeners are edge triggered, so the next connection is accepted now
+    assert poll(server, [client], 1, lambda: server.sockets)
+
+def test_accept_failed(server, capsys):
+    from client import pypilotClient
+    fail_accept(server, errno.EMFILE, 3)
+    client = pypilotClient('localhost')
+    # the waiting connection is accepted on a later poll without another edge
+    assert poll(server, [client], 2, lambda: server.sockets)
+    assert len(server.sockets) == 1
+    assert capsys.readouterr().out.count('failed to accept connection') == 1
+
+def test_unix_socket(server, monkeypatch):
+    import client as pypilot_client
+    client = connect(server)
+    assert poll(server, [client], 1, lambda: server.sockets)
+    assert server.sockets[0].address == ('127.0.0.1', 0) # local, over the unix socket
+    assert client.connection.socket.family == socket.AF_UNIX
+
+    # without a unix socket clients connect over tcp
+    monkeypatch.setattr(pypilot_client, 'unix_socket_name', '\0pypilot-test-missing')
+    tcp = connect(server)
+    assert tcp.connection.socket.family == socket.AF_INET
+    assert poll(server, [client, tcp], 1, lambda: len(server.sockets) == 2)
+    assert server.sockets[1].address[1]
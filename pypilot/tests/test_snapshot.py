@@ -0,0 +1,29 @@
+import pyjson
+from conftest import poll, connect
+
+def snapshot(server, clients, client, names):
+    client.replies['snapshot'] = False
+    client.send('snapshot=' + pyjson.dumps(names) + '\n')
+    assert poll(server, clients, 2, lambda: client.replies['snapshot'] is not False)
+    return client.replies.pop('snapshot')
+
+def test_snapshot(server):
+    from client import pypilotClient
+    from values import SensorValue, EnumProperty
+    owner = pypilotClient(server)
+    heading = owner.register(SensorValue('imu.heading', 1))
+    owner.register(SensorValue('imu.pitch', 2))
+    mode = owner.register(EnumProperty('ap.mode', 'compass', ['compass', 'gps']))
+    client = connect(server)
+    poll(server, [owner, client], .2)
+
+    # not watched, so the server asks the owners for current values
+    heading.set(3)
+    mode.set('gps')
+    clients = [owner, client]
+    assert snapshot(server, clients, client, ['imu.heading', 'ap.mode', 'unknown']) == \
+        {'imu.heading': 3, 'ap.mode': 'gps'}
+    assert snapshot(server, clients, client, ['imu.*']) == {'imu.heading': 3, 'imu.pitch': 2}
+    values = snapshot(server, clients, client, True)
+    assert values['ap.mode'] == 'gps' and values['imu.pitch'] == 2
+    assert not heading.watch and not server.values.values['imu.heading'].awatches
@@ -0,0 +1,33 @@
+import pyjson
+from conftest import poll, connect
+
+def test_stats_cached(server, monkeypatch):
+    poll(server, [], .1)
+    stats = server.values.stats
+    def fail(t0):
+        raise AssertionError('stats computed when read')
+    monkeypatch.setattr(stats, 'stats', fail)
+    for i in range(3):
+        msg = stats.get_msg()
+    assert pyjson.loads(msg.split('=', 1)[1]) == {'connections': [], 'values': {}}
+
+def test_stats_updates(server):
+    from client import pypilotClient
+    from values import SensorValue
+    owner = pypilotClient(server)
+    heading = owner.register(SensorValue('imu.heading', 0))
+    client = connect(server)
+    client.watch('imu.heading')
+    client.watch('server.stats')
+    received = []
+    def done():
+        heading.set(heading.value + 1)
+        msgs = client.receive()
+        if 'server.stats' in msgs:
+            received.append(msgs['server.stats'])
+        return len(received) >= 3 # the cached message, then each second
+    assert poll(server, [owner, client], 5, done)
+    stats = received[-1]
+    assert stats['values']['imu.heading']['fanout'] == 1
+    assert stats['values']['imu.heading']['rate'] > 0
+    assert len(stats['connections']) == 1
@@ -0,0 +1,35 @@
+import time
+from types import SimpleNamespace
+
+from timerwheel import TimerWheel
+
+def item(t):
+    return SimpleNamespace(time=t)
+
+def test_expire():
+    wheel = TimerWheel(resolution=.01, slots=16)
+    t0 = wheel.tick * .01
+    items = [item(t0 + dt) for dt in [.05, .02, .3, .02, 1]] # .3 and 1 wrap the wheel
+    for i in items:
+        wheel.insert(i)
+    assert len(wheel) == 5
+    assert wheel.expire(t0 + .01) == []
+    assert wheel.expire(t0 + .025) == [items[1], items[3]]
+    assert abs(wheel.next_time(1) - (t0 + .05)) < .011
+    assert wheel.expire(t0 + .2) == [items[0]] # not those a turn ahead
+    assert wheel.expire(t0 + .35) == [items[2]]
+    assert len(wheel) == 1
+    assert wheel.expire(t0 + 5) == [items[4]] # long after
+    assert not len(wheel) and wheel.next_time(1) is None
+
+def test_insert_past():
+    wheel = TimerWheel()
+    late = item(time.monotonic() - 10)
+    wheel.insert(late)
+    assert wheel.expire(time.monotonic()) == [late]
+
+def test_next_time_limit():
+    wheel = TimerWheel(resolution=.01, slots=512)
+    t0 = wheel.tick * .01
+    wheel.insert(item(t0 + 3))
+    assert abs(wheel.next_time(.5) - (t0 + .5)) < .011 # searched no further
@@ -0,0 +1,25 @@
+from values import Value, SensorValue, RangeProperty, BooleanProperty
+
+def test_line_cached():
+    value = SensorValue('imu.heading', 1.23456)
+    calls = []
+    get_msg = value.get_msg
+    value.get_msg = lambda: calls.append(1) or get_msg()
+    line = value.get_line()
+    assert line == 'imu.heading=1.2346\n'
+    assert value.get_line() is line and len(calls) == 1
+    value.set(2)
+    assert value.get_line() == 'imu.heading=2.0000\n' and len(calls) == 2
+
+def test_line_changed():
+    value = RangeProperty('ap.gain', 5, 0, 10)
+    assert value.get_line() == 'ap.gain=5.0000\n'
+    value.set(20) # invalid, unchanged
+    assert value.get_line() == 'ap.gain=5.0000\n'
+    value.set_max(3)
+    assert value.get_line() == 'ap.gain=3.0000\n'
+    flag = BooleanProperty('ap.enabled', False)
+    flag.set(1)
+    assert flag.get_line() == 'ap.enabled=true\n'
+    text = Value('ap.mode', 'gps')
+    assert text.get_line() == 'ap.mode="gps"\n'
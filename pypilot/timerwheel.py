@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+#
+#   Copyright (C) 2022 Sean D'Epagnier
+#
+# This Program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation; either
+# version 3 of the License, or (at your option) any later version.
+
+import time
+
+# hashed timer wheel for periodic watches
+# items have a time attribute and are placed in the slot for that time,
+# items more than a turn of the wheel ahead stay in their slot until due
+# inserting and expiring are constant time
+class TimerWheel(object):
+    def __init__(self, resolution=.01, slots=512):
+        self.resolution = resolution
+        self.slots = [[] for i in range(slots)]
+        self.tick = int(time.monotonic() / resolution) # next tick to expire
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def insert(self, item):
+        tick = max(int(item.time / self.resolution), self.tick)
+        self.slots[tick % len(self.slots)].append(item)
+        self.count += 1
+
+    # remove and return items due by time t
+    def expire(self, t):
+        ready = []
+        if not self.count:
+            self.tick = int(t / self.resolution) + 1
+            return ready
+
+        tick = int(t / self.resolution)
+        n = len(self.slots)
+        for i in range(self.tick, min(tick + 1, self.tick + n)):
+            slot = self.slots[i % n]
+            if not slot:
+                continue
+            later = []
+            for item in slot:
+                if int(item.time / self.resolution) <= tick:
+                    ready.append(item)
+                else:
+                    later.append(item) # a later turn of the wheel
+            self.slots[i % n] = later
+        self.tick = tick + 1
+        self.count -= len(ready)
+        return ready
+
+    # time when the next item is due, only searching up to limit seconds ahead
+    def next_time(self, limit):
+        if not self.count:
+            return None
+        n = len(self.slots)
+        ticks = min(int(limit / self.resolution), n)
+        for tick in range(self.tick, self.tick + ticks):
+            for item in self.slots[tick % n]:
+                if int(item.time / self.resolution) <= tick:
+                    return tick * self.resolution
+        return (self.tick + ticks) * self.resolution
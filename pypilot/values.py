@@ -15,6 +15,7 @@ class Value(object):
     def __init__(self, name, initial, **kwargs):
         self.name = name
         self.watch = False
+        self.line = None
         self.set(initial)
 
         self.info = {'type': 'Value'}
@@ -24,6 +25,9 @@ class Value(object):
         # if persistent argument make the server store/load this value regularly
         if 'persistent' in kwargs and kwargs['persistent']:
             self.info['persistent'] = True
+        # if control argument the server handles and sends this value ahead of others
+        if 'control' in kwargs and kwargs['control']:
+            self.info['control'] = True
 
     def update(self, value):
         if self.value != value:
@@ -36,11 +40,18 @@ class Value(object):
             return 'true' if self.value else 'false'
         return str(self.value)
 
+    # message line to send, cached until the value is set again
+    def get_line(self):
+        if self.line is None:
+            self.line = self.name + '=' + self.get_msg() + '\n'
+        return self.line
+
     def set(self, value):
         self.value = value
+        self.line = None
         if self.watch:
             if self.watch.period == 0: # and False:   # disable immediate
-                self.client.send(self.name+'='+self.get_msg()+'\n')
+                self.client.send(self.get_line())
 
             elif self.pwatch:
                 t0 = time.monotonic()
@@ -102,6 +113,9 @@ class SensorValue(Value):
         self.info['type'] = 'SensorValue'
         if self.directional:
             self.info['directional'] = True
+        # if history argument the server records recent samples of this value
+        if 'history' in kwargs and kwargs['history']:
+            self.info['history'] = True
 
     def get_msg(self):
         value = self.value
@@ -166,6 +180,7 @@ class RangeProperty(Property):
     def set_max(self, max_value):
         if self.value > max_value:
             self.value = max_value
+            self.line = None
         self.max_value = max_value
 
 # a range property that is persistent and specifies the units
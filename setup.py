@@ -145,6 +145,7 @@ setup (name = 'pypilot',
                'pypilot_control=pypilot.ui.autopilot_control:main',
                'pypilot_calibration=pypilot.ui.autopilot_calibration:main',
                'pypilot_client=pypilot.client:main',
+               'pypilot_replay=pypilot.recorder:main',
                'pypilot_scope=pypilot.ui.scope_wx:main',
                'pypilot_client_wx=pypilot.ui.client_wx:main'
                ]
@@ -163,30 +163,50 @@ class pypilotPlot():
         self.traces = []
         self.timestamp = False
 
-    def add_data(self, name, group, timestamp, value):
-        t = False
+    def get_trace(self, name, group):
         for tn in self.traces:
             if tn.name == name:
-                t = tn
-                break
+                return tn
 
+        for tn in self.traces:
+            if name == group and tn.group == group:
+                return False
+
+        directional = name in self.value_list and \
+                      'directional' in self.value_list[name] and \
+                      self.value_list[name]['directional']
+        t = trace(name, group, len(self.traces), directional)
+        self.traces.append(t)
+#        if not self.curtrace:
+        self.curtrace = t
+        return t
+
+    def add_data(self, name, group, timestamp, value):
+        t = self.get_trace(name, group)
         if not t:
-            for tn in self.traces:
-                if name == group and tn.group == group:
-                    return
-
-            directional = name in self.value_list and \
-                          'directional' in self.value_list[name] and \
-                          self.value_list[name]['directional']
-            t = trace(name, group, len(self.traces), directional)
-            self.traces.append(t)
-#            if not self.curtrace:
-            self.curtrace = t
+            return
 
         # time must change by 1 pixel to bother to log and display
         mindt = self.disptime / float(self.width)
         return t.add(timestamp, value, mindt) and t.visible
         
+    # samples the server recorded before the scope started, only those older
+    # than the points already received so the points stay newest first
+    def add_history(self, history):
+        if not self.timestamp:
+            return False # times are relative to the current timestamp
+        for name, (times, values) in history.items():
+            t = self.get_trace(name, name)
+            if not t:
+                continue
+            oldest = t.points[-1][0] if t.points else self.timestamp + 1
+            for ht, value in zip(reversed(times), reversed(values)):
+                if self.timestamp + ht < oldest:
+                    t.points.append((self.timestamp + ht, value))
+            if not t.timeoff:
+                t.timeoff = time.monotonic() - self.timestamp
+        return True
+
     def add_blank(self, group=False):
         for t in self.traces:
             if not group or group == t.group:
@@ -411,6 +431,7 @@ def main():
     if len(sys.argv) > 1:
         host, args = sys.argv[1], sys.argv[2:]
     client = pypilotClientFromArgs(args, host=host)
+    history = [False]
     
     def idle():
         while True:
@@ -418,6 +439,8 @@ def main():
                 result = client.receive_single()
                 if result:
                     plot.read_data(result)
+                    if history[0] and plot.add_history(history[0]):
+                        history[0] = False
                 else:
                     time.sleep(.01)
                     break
@@ -441,6 +464,7 @@ def main():
     glutIdleFunc(idle)
 
     plot.init(client.list_values(10))
+    history[0] = client.history({name: plot.disptime for name in client.watches})
 
     fps = 30
     def timeout(arg):
@@ -6,7 +6,7 @@
 # License as published by the Free Software Foundation; either
 # version 3 of the License, or (at your option) any later version.  
 
-import sys, os
+import sys, os, time
 from flask import Flask, render_template, session, request, Markup
 
 from flask_socketio import SocketIO, Namespace, emit, join_room, leave_room, \
@@ -15,7 +15,7 @@ from flask_socketio import SocketIO, Namespace, emit, join_room, leave_room, \
 from engineio.payload import Payload
 Payload.max_decode_packets = 500
 
-from pypilot.client import pypilotClient
+from pypilot.client import pypilotClient, watch_period
 from pypilot import pyjson
 
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
@@ -200,53 +200,123 @@ with open(os.path.dirname(os.path.abspath(__file__)) + '/pypilot_web.pot') as f:
 def index():
     return render_template('index.html', async_mode=socketio.async_mode, pypilot_web_port=pypilot_web_port, tinypilot=tinypilot.tinypilot, translations=translations, language=config['language'], languages=Markup(LANGUAGES))
 
+# state of a browser session sharing the upstream pypilot connection
+class WebSession(object):
+    def __init__(self):
+        self.watches = {} # watch request of each watched value
+        self.sent = {} # time each value was last sent
+        self.pending = set() # values updated since last sent
+
 class pypilotWeb(Namespace):
     def __init__(self, name):
         super(Namespace, self).__init__(name)
+        self.client = pypilotClient(resume=True) # one connection for all sessions
+        self.sessions = {}
+        self.last_values = {} # latest value of each upstream watch
+        self.values_list = False
+        self.connected = False
         socketio.start_background_task(target=self.background_thread)
-        self.clients = {}
+
+    # watch upstream at the fastest rate any session requests
+    def update_watch(self, name):
+        period = False
+        for websession in self.sessions.values():
+            if name in websession.watches:
+                watch = websession.watches[name]
+                if period is False or watch_period(watch) < watch_period(period):
+                    period = watch
+        if period is False:
+            if name in self.last_values:
+                del self.last_values[name]
+        elif period == 0:
+            period = True
+        self.client.watch(name, period)
 
     def background_thread(self):
         print('processing clients')
-        x = 0
         while True:
-            socketio.sleep(.25)
+            socketio.sleep(.05)
             sys.stdout.flush() # update log
-            sids = list(self.clients)
-            for sid in sids:
-                if not sid in self.clients:
-                    print('client was removed')
-                    continue # was removed
-
-                client = self.clients[sid]
-                values = client.list_values()
-                if values:
-                    socketio.emit('pypilot_values', pyjson.dumps(values), room=sid)
-                if not client.connection:
-                    socketio.emit('pypilot_disconnect', room=sid)
-                msgs = client.receive()
-                if msgs:
-                    # convert back to json (format is nicer)
-                    #print('msgs', msgs, sid)
-                    socketio.emit('pypilot', pyjson.dumps(msgs), room=sid)
+            values = self.client.list_values()
+            if values:
+                self.values_list = pyjson.dumps(values)
+                socketio.emit('pypilot_values', self.values_list)
+
+            connected = bool(self.client.connection)
+            if connected != self.connected:
+                self.connected = connected
+                if not connected:
+                    socketio.emit('pypilot_disconnect')
+
+            msgs = self.client.receive()
+            self.last_values.update(msgs)
+            self.send_updates(msgs)
+
+    def send_updates(self, msgs):
+        t0 = time.monotonic()
+        payloads = {} # sessions sending the same values share the payload
+        for sid, websession in list(self.sessions.items()):
+            for name in msgs:
+                if name in websession.watches:
+                    websession.pending.add(name)
+            if not websession.pending:
+                continue
+
+            names = []
+            for name in websession.pending:
+                if t0 - websession.sent.get(name, 0) >= watch_period(websession.watches[name]):
+                    names.append(name)
+            if not names:
+                continue
+            names = tuple(sorted(names))
+            if not names in payloads:
+                # convert back to json (format is nicer)
+                payloads[names] = pyjson.dumps({name: self.last_values[name] for name in names})
+            socketio.emit('pypilot', payloads[names], room=sid)
+            for name in names:
+                websession.sent[name] = t0
+                websession.pending.remove(name)
 
     def on_pypilot(self, message):
         #print('message', message)
-        self.clients[request.sid].send(message + '\n')
+        if not message.startswith('watch='):
+            self.client.send(message + '\n')
+            return
+
+        websession = self.sessions[request.sid]
+        try:
+            watches = pyjson.loads(message[6:])
+        except Exception as e:
+            print('invalid watch from client', message, e)
+            return
+        for name, period in watches.items():
+            if period is False:
+                if name in websession.watches:
+                    del websession.watches[name]
+                websession.pending.discard(name)
+            else:
+                websession.watches[name] = period
+                if name in self.last_values: # already watched, send latest value
+                    websession.pending.add(name)
+                    websession.sent.pop(name, None)
+            self.update_watch(name)
 
     def on_ping(self):
         emit('pong')
 
     def on_connect(self):
         print('Client connected', request.sid)
-        client = pypilotClient()
-        self.clients[request.sid] = client
+        self.sessions[request.sid] = WebSession()
+        if not self.connected:
+            emit('pypilot_disconnect')
+        elif self.values_list:
+            emit('pypilot_values', self.values_list)
 
     def on_disconnect(self):
         print('Client disconnected', request.sid)
-        client = self.clients[request.sid]
-        client.disconnect()
-        del self.clients[request.sid]
+        websession = self.sessions.pop(request.sid)
+        for name in websession.watches:
+            self.update_watch(name)
 
     def on_language(self, language):
         config['language'] = language